@@ -1,23 +1,27 @@
 """
 RPG Maker MZ Agents - LangGraph implementation of agent architecture
 """
+from __future__ import annotations
+
 import os
 import json
-from typing import Dict, List, Any, Optional
-from langchain.llms import BaseLLM
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-try:
-    from langgraph.graph import StateGraph, END
-except ImportError:
-    print("LangGraph not installed. Install with: pip install langgraph")
-    # Define placeholder to allow code to parse
-    class StateGraph:
-        def __init__(self, *args, **kwargs):
-            pass
-    END = "END"
-
-from rmmz_tools import RPGMakerTools
+import asyncio
+import logging
+import contextlib
+import functools
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Any, Optional, Tuple, Callable, AsyncIterator
+
+logger = logging.getLogger("rmmz.agents")
+
+# LangChain and LangGraph are slow to import, so they are imported where they
+# are first used rather than when this module loads
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseLanguageModel
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.prompt_values import PromptValue
+
+from rmmz_tools import RPGMakerTools, EventPage, EventCommand, message_command, text_command, choice_commands
 from rmmz_schemas import (
     GameDataSchema, GameMetadata, GameLocation, GameCharacter, 
     GameQuest, DialogueData, BattleEncounter,
@@ -26,253 +30,413 @@ from rmmz_schemas import (
     GameImplementationState, AgentTask
 )
 
-# Agent prompt templates
-DIRECTOR_PROMPT = """
-You are the Director Agent responsible for coordinating the implementation of an RPG Maker MZ game.
-Your task is to analyze the game description and create implementation tasks for other specialized agents.
-
-Current Game Data:
-{game_data}
-
-Current Implementation State:
-{implementation_state}
-
-Current Task:
-{current_task}
-
-Your job is to:
-1. Break down the game creation into smaller tasks
-2. Prioritize tasks based on dependencies
-3. Assign tasks to appropriate specialized agents
-4. Track progress and resolve issues
-
-Based on the current state, provide your analysis and next steps in the following format:
-- Analysis: [Your understanding of the current state]
-- Task Queue: [List of tasks to be done with priorities]
-- Agent Assignments: [Which agents should work on which tasks]
-- Implementation Progress: [Estimation of overall progress]
-
-Response:
-"""
-
-WORLD_BUILDER_PROMPT = """
-You are the World Builder Agent responsible for creating maps and environments in an RPG Maker MZ game.
-Your task is to convert location descriptions into map data and create the physical world of the game.
-
-Current Game Data:
-{game_data}
-
-Current Implementation State:
-{implementation_state}
-
-Current Task:
-{current_task}
-
-Location Details:
-{location_details}
-
-Your job is to:
-1. Analyze the location description
-2. Determine appropriate map size and tileset
-3. Plan the layout of the map including terrain, buildings, and points of interest
-4. Create the map programmatically using RPGMakerTools
-
-Provide your implementation details in the following format:
-- Map Analysis: [Your understanding of the location]
-- Map Parameters: [Size, tileset, features needed]
-- Layout Plan: [Description of how you'll arrange the map]
-- Implementation Steps: [Specific code or functions you'd use]
-
-Response:
-"""
-
-EVENT_ENGINEER_PROMPT = """
-You are the Event Engineer Agent responsible for implementing events, dialogue, and narrative in an RPG Maker MZ game.
-Your task is to convert script elements into event commands and create interactive elements.
-
-Current Game Data:
-{game_data}
-
-Current Implementation State:
-{implementation_state}
-
-Current Task:
-{current_task}
+# LLM response cache backend: "sqlite" (default), "redis" or "none"
+LLM_CACHE_BACKEND = os.environ.get("RMMZ_LLM_CACHE_BACKEND", "sqlite")
+LLM_CACHE_PATH = os.environ.get("RMMZ_LLM_CACHE_PATH", ".rmmz_llm_cache.db")
+LLM_CACHE_REDIS_URL = os.environ.get("RMMZ_LLM_CACHE_REDIS_URL", "redis://localhost:6379/0")
 
-Event Details:
-{event_details}
+_llm_cache_configured = False
 
-Your job is to:
-1. Analyze the narrative or interaction requirements
-2. Create appropriate event pages with conditions
-3. Implement dialogue, choices, and other interactive elements
-4. Link events to game progression mechanics
-
-Provide your implementation details in the following format:
-- Event Analysis: [Your understanding of what needs to be implemented]
-- Event Structure: [Pages, conditions, triggers needed]
-- Command Sequence: [List of commands you'll implement]
-- Implementation Steps: [Specific code or functions you'd use]
-
-Response:
-"""
-
-COMBAT_SYSTEM_PROMPT = """
-You are the Combat System Agent responsible for implementing battle mechanics in an RPG Maker MZ game.
-Your task is to create enemies, skills, and battle events based on the game design.
-
-Current Game Data:
-{game_data}
-
-Current Implementation State:
-{implementation_state}
-
-Current Task:
-{current_task}
-
-Combat Details:
-{combat_details}
-
-Your job is to:
-1. Analyze the combat requirements from the game design
-2. Create appropriate enemies, skills, and battle events
-3. Balance combat parameters for appropriate difficulty
-4. Implement custom battle mechanics as needed
-
-Provide your implementation details in the following format:
-- Combat Analysis: [Your understanding of the requirements]
-- Entity Design: [Enemies, skills, or other elements to create]
-- Balance Considerations: [How you're approaching difficulty]
-- Implementation Steps: [Specific code or functions you'd use]
-
-Response:
-"""
-
-ASSET_MANAGER_PROMPT = """
-You are the Asset Manager Agent responsible for organizing and managing game resources in an RPG Maker MZ game.
-Your task is to identify needed assets and ensure they're properly integrated.
+def configure_llm_cache(backend: str = LLM_CACHE_BACKEND):
+    """Install a global LLM cache so identical prompts are answered without an API call"""
+    global _llm_cache_configured
+    try:
+        from langchain_core.globals import set_llm_cache
+        from langchain_community.cache import SQLiteCache, RedisCache
+    except ImportError:
+        logger.warning("LangChain community not installed. Install with: pip install langchain-community")
+        return
+    
+    _llm_cache_configured = True
+    if backend == "none":
+        set_llm_cache(None)
+    elif backend == "redis":
+        import redis
+        set_llm_cache(RedisCache(redis.Redis.from_url(LLM_CACHE_REDIS_URL)))
+    elif backend == "sqlite":
+        set_llm_cache(SQLiteCache(database_path=LLM_CACHE_PATH))
+    else:
+        raise ValueError(f"Unknown LLM cache backend: {backend}")
 
-Current Game Data:
-{game_data}
+# SQLite database holding workflow checkpoints, one thread per game title
+CHECKPOINT_DB = os.environ.get("RMMZ_CHECKPOINT_DB", "rmmz_state.db")
 
-Current Implementation State:
-{implementation_state}
+# Maximum number of LLM calls in flight when the director batches ready tasks
+LLM_MAX_CONCURRENCY = int(os.environ.get("RMMZ_LLM_MAX_CONCURRENCY", "10"))
 
-Current Task:
-{current_task}
+# Output token budget per agent type. Each call is capped at its agent's budget, and
+# batched calls are grouped by budget so a continuous-batching server (e.g. vLLM)
+# schedules requests of similar length together
+MAX_TOKENS = {
+    "director": 1024,
+    "world_builder": 512,
+    "event_engineer": 1024,
+    "combat_system": 768,
+    "asset_manager": 256,
+    "tester": 512,
+}
 
-Asset Requirements:
-{asset_requirements}
+# Fast and smart models: agents hinted "fast" try the fast model first and fall
+# back to the smart model when its reply fails validation
+FAST_MODEL = os.environ.get("RMMZ_FAST_MODEL", "gpt-4o-mini")
+SMART_MODEL = os.environ.get("RMMZ_SMART_MODEL", "gpt-4o")
 
-Your job is to:
-1. Analyze what assets are needed based on the game design
-2. Identify appropriate existing assets or note custom assets needed
-3. Organize asset files and ensure proper references
-4. Update database entries to use the correct assets
+# Replies shorter than this are never accepted from the fast model
+MIN_RESPONSE_CHARS = 20
 
-Provide your implementation details in the following format:
-- Asset Analysis: [Your understanding of what's needed]
-- Asset Availability: [What's available vs. what's missing]
-- Organization Plan: [How you'll structure the assets]
-- Implementation Steps: [Specific code or functions you'd use]
+def create_openai_llms() -> Tuple[BaseLanguageModel, BaseLanguageModel]:
+    """Create the fast and smart OpenAI chat models named by RMMZ_FAST_MODEL and RMMZ_SMART_MODEL"""
+    try:
+        from langchain_openai import ChatOpenAI
+    except ImportError:
+        logger.warning("LangChain OpenAI not installed. Install with: pip install langchain-openai")
+        raise
+    
+    return ChatOpenAI(model=FAST_MODEL), ChatOpenAI(model=SMART_MODEL)
 
-Response:
-"""
+# Task types and the specialized agent responsible for each
+TASK_AGENT_TYPES = {
+    "map_creation": "world_builder",
+    "event_creation": "event_engineer",
+    "cutscene_creation": "event_engineer",
+    "dialogue_creation": "event_engineer",
+    "skill_creation": "combat_system",
+    "enemy_creation": "combat_system",
+    "troop_creation": "combat_system",
+    "asset_management": "asset_manager",
+}
 
-TESTING_PROMPT = """
-You are the Testing Agent responsible for validating implementations in an RPG Maker MZ game.
-Your task is to test features and identify issues or inconsistencies.
+# Agent prompts: a static system message per agent (an identical prefix on every
+# call, so providers with prompt caching can reuse it) and a minimal human message
+DIRECTOR_SYSTEM_PROMPT = """You are the Director Agent coordinating the implementation of an RPG Maker MZ game.
+Break the game into tasks, order them by dependencies, assign them to the world_builder, event_engineer, combat_system, asset_manager and tester agents, and track progress.
+Reply with JSON only: {{"analysis": str, "task_queue": [{{"id": str, "type": str, "description": str, "priority": int, "dependencies": [str]}}], "agent_assignments": {{agent: [task_id]}}, "implementation_progress": float}}"""
 
-Current Game Data:
-{game_data}
+WORLD_BUILDER_SYSTEM_PROMPT = """You are the World Builder Agent creating maps for an RPG Maker MZ game.
+Turn the location into a map: pick its size and tileset and plan terrain, buildings and points of interest.
+Reply with JSON only: {{"analysis": str, "width": int, "height": int, "tileset_id": int, "features": [str], "layout": str}}"""
 
-Current Implementation State:
-{implementation_state}
+EVENT_ENGINEER_SYSTEM_PROMPT = """You are the Event Engineer Agent implementing events, dialogue and narrative for an RPG Maker MZ game.
+Turn the event details into event pages with conditions, triggers, dialogue and choices linked to game progression.
+Reply with JSON only: {{"analysis": str, "pages": [{{"trigger": int, "conditions": object, "commands": [str]}}]}}"""
 
-Current Task:
-{current_task}
+COMBAT_SYSTEM_SYSTEM_PROMPT = """You are the Combat System Agent implementing battle mechanics for an RPG Maker MZ game.
+Design balanced enemies, skills and battle events for the combat details.
+Reply with JSON only: {{"analysis": str, "enemies": [object], "skills": [object], "balance_notes": str}}"""
 
-Test Scenario:
-{test_scenario}
+ASSET_MANAGER_SYSTEM_PROMPT = """You are the Asset Manager Agent organizing resources for an RPG Maker MZ game.
+Work out which assets are needed, which exist and which are missing, and how database entries should reference them.
+Reply with JSON only: {{"analysis": str, "available": [str], "missing": [str], "mappings": {{entry: asset}}}}"""
 
-Your job is to:
-1. Analyze the implemented feature or component
-2. Design test scenarios to validate functionality
-3. Identify any issues, bugs, or inconsistencies
-4. Provide feedback for improvement
+TESTING_SYSTEM_PROMPT = """You are the Testing Agent validating implementations in an RPG Maker MZ game.
+Design test scenarios for the feature, report issues and inconsistencies, and recommend fixes.
+Reply with JSON only: {{"scenarios": [str], "issues": [str], "recommendations": [str]}}"""
 
-Provide your testing results in the following format:
-- Test Analysis: [Your understanding of what to test]
-- Test Scenarios: [Specific tests you're performing]
-- Test Results: [Findings from your tests]
-- Recommendations: [Suggestions for fixing issues]
+HUMAN_PROMPT = "Game:{game_data}\nState:{implementation_state}\nTask:{current_task}"
 
-Response:
-"""
+@functools.lru_cache(maxsize=None)
+def get_prompts() -> Dict[str, ChatPromptTemplate]:
+    """Prompt templates keyed by agent type, compiled once on first use"""
+    from langchain_core.prompts import ChatPromptTemplate
+    
+    return {
+        "director": ChatPromptTemplate.from_messages([
+            ("system", DIRECTOR_SYSTEM_PROMPT),
+            ("human", HUMAN_PROMPT)
+        ]),
+        "world_builder": ChatPromptTemplate.from_messages([
+            ("system", WORLD_BUILDER_SYSTEM_PROMPT),
+            ("human", HUMAN_PROMPT + "\nLocation:{location_details}")
+        ]),
+        "event_engineer": ChatPromptTemplate.from_messages([
+            ("system", EVENT_ENGINEER_SYSTEM_PROMPT),
+            ("human", HUMAN_PROMPT + "\nEvent:{event_details}")
+        ]),
+        "combat_system": ChatPromptTemplate.from_messages([
+            ("system", COMBAT_SYSTEM_SYSTEM_PROMPT),
+            ("human", HUMAN_PROMPT + "\nCombat:{combat_details}")
+        ]),
+        "asset_manager": ChatPromptTemplate.from_messages([
+            ("system", ASSET_MANAGER_SYSTEM_PROMPT),
+            ("human", HUMAN_PROMPT + "\nAssets:{asset_requirements}")
+        ]),
+        "tester": ChatPromptTemplate.from_messages([
+            ("system", TESTING_SYSTEM_PROMPT),
+            ("human", HUMAN_PROMPT + "\nScenario:{test_scenario}")
+        ]),
+    }
 
 class RPGMakerAgent:
     """Base class for all RPG Maker agents"""
     
-    def __init__(self, agent_id: str, agent_type: str, llm: Optional[BaseLLM] = None):
+    # Key of the prompt used for this agent's tasks, None if the agent doesn't call the LLM per task
+    prompt_name: Optional[str] = None
+    
+    # "fast" to try the fast model before the smart one, "smart" to always use the smart model
+    complexity_hint = "smart"
+    
+    # Keys a JSON reply must contain to be accepted from the fast model
+    required_keys: Tuple[str, ...] = ()
+    
+    def __init__(self, agent_id: str, agent_type: str, llm: Optional[BaseLanguageModel] = None):
         self.agent_id = agent_id
         self.agent_type = agent_type
         self.llm = llm
+        self.fast_llm = None  # Optional cheaper model tried first for "fast" agents
+        self.stream_callback = None  # Optional callback(display_name, chunk) for streamed replies
         self.tools = None  # Will be initialized with RPGMakerTools
+        self.task_types = tuple(t for t, a in TASK_AGENT_TYPES.items() if a == agent_type)
+        self.display_name = agent_type.replace("_", " ").title() + " Agent"
+        self.max_tokens = MAX_TOKENS.get(agent_type)
     
     def set_tools(self, tools: RPGMakerTools):
         """Set the RPG Maker tools for this agent"""
         self.tools = tools
     
-    def process(self, state: GameImplementationState) -> GameImplementationState:
-        """Process the current state and return updated state"""
-        raise NotImplementedError("Subclasses must implement process()")
-
-    def _run_llm_chain(self, prompt_template: str, **kwargs) -> str:
+    def set_fast_llm(self, fast_llm: Optional[BaseLanguageModel]):
+        """Set the fast model tried before the smart one"""
+        self.fast_llm = fast_llm
+    
+    def set_stream_callback(self, stream_callback: Optional[Callable[[str, str], None]]):
+        """Stream single replies to stream_callback(display_name, chunk) as they arrive
+        Streamed calls bypass the LLM cache, so replies are only streamed when a callback is set.
+        """
+        self.stream_callback = stream_callback
+    
+    def validate_response(self, response: str) -> bool:
+        """Cheap check that a reply is usable: long enough and a JSON object with the required keys"""
+        if len(response) < MIN_RESPONSE_CHARS:
+            return False
+        
+        # Tolerate prose or code fences around the JSON object
+        start, end = response.find("{"), response.rfind("}")
+        if start < 0 or end < start:
+            return False
+        try:
+            reply = json.loads(response[start:end + 1])
+        except ValueError:
+            return False
+        return isinstance(reply, dict) and all(key in reply for key in self.required_keys)
+    
+    def init_state(self, state: GameImplementationState):
+        """Initialize this agent's state if not present"""
+        raise NotImplementedError("Subclasses must implement init_state()")
+    
+    def claim_task(self, state: GameImplementationState) -> Optional[AgentTask]:
+        """Take the next ready task for this agent and mark it in progress"""
+        task = state.director.tasks.pop_ready(self.task_types)
+        if not task:
+            return None
+        
+        # Update task status
+        task.status = "in_progress"
+        task.assigned_to = self.agent_id
+        getattr(state, self.agent_type).current_task = task
+        state.mutate(fields=("director", self.agent_type))
+        return task
+    
+    def claim_all(self, state: GameImplementationState) -> List[AgentTask]:
+        """Claim every ready task for this agent, initializing its state first"""
+        self.init_state(state)
+        tasks = []
+        task = self.claim_task(state)
+        while task:
+            tasks.append(task)
+            task = self.claim_task(state)
+        return tasks
+    
+    def prompt_inputs(self, state: GameImplementationState, task: AgentTask) -> Dict[str, str]:
+        """Build the prompt variables for a claimed task"""
+        raise NotImplementedError("Subclasses must implement prompt_inputs()")
+    
+    def state_slice_json(self, state: GameImplementationState) -> str:
+        """Get this agent's own part of the implementation state as JSON
+        The task is sent separately, so only the agent's progress is included.
+        """
+        return state.cached_json(self.agent_type, exclude={"agent_id", "agent_type", "current_task"})
+    
+    def handle_response(self, state: GameImplementationState, task: AgentTask, response: str):
+        """Apply the LLM response for a claimed task to the state"""
+        raise NotImplementedError("Subclasses must implement handle_response()")
+    
+    async def aprocess(self, state: GameImplementationState) -> GameImplementationState:
+        """Process all ready tasks for this agent and return updated state"""
+        # Claim every ready task up front so they can share one LLM batch
+        tasks = self.claim_all(state)
+        if not tasks:
+            # No tasks for this agent
+            return state
+        
+        if len(tasks) == 1:
+            responses = [await self._arun_llm_chain(self.prompt_template, **self.prompt_inputs(state, tasks[0]))]
+        else:
+            prompts = [self.prompt_template.format_prompt(**self.prompt_inputs(state, t)) for t in tasks]
+            responses = await self._abatch_llm_chain(prompts)
+            for response in responses:
+                logger.debug("%s Response:\n%s", self.display_name, response)
+        
+        for task, response in zip(tasks, responses):
+            self.handle_response(state, task, response)
+        return state
+    
+    @property
+    def prompt_template(self) -> Optional[ChatPromptTemplate]:
+        """Prompt used for this agent's tasks"""
+        return get_prompts()[self.prompt_name] if self.prompt_name else None
+    
+    def _placeholder_response(self) -> str:
+        """Response used when no LLM is configured"""
+        return f"[LLM not initialized - {self.agent_type} would generate a response here]"
+    
+    async def _arun_llm_chain(self, template: ChatPromptTemplate, **kwargs) -> str:
         """Run an LLM chain with the given template and kwargs"""
+        response = None
         if self.llm is None:
-            return f"[LLM not initialized - {self.agent_type} would generate a response here]"
+            response = self._placeholder_response()
+        elif self.complexity_hint == "fast" and self.fast_llm is not None:
+            reply = await self._ainvoke_text(self.fast_llm, template, kwargs)
+            if self.validate_response(reply):
+                response = reply
+            else:
+                logger.debug("%s: fast model reply failed validation, retrying with the smart model", self.display_name)
+        if response is None:
+            response = await self._ainvoke_text(self.llm, template, kwargs)
+        
+        logger.debug("%s Response:\n%s", self.display_name, response)
+        return response
+    
+    async def _ainvoke_text(self, llm: BaseLanguageModel, template: ChatPromptTemplate, kwargs: Dict[str, Any]) -> str:
+        """Get a reply from the given model as one string
+        With a stream callback set, the reply is streamed and each chunk passed to it.
+        """
+        if self.stream_callback is None:
+            from langchain_core.output_parsers import StrOutputParser
+            chain = template | self._bind_max_tokens(llm, self.max_tokens) | StrOutputParser()
+            return await chain.ainvoke(kwargs)
         
-        prompt = PromptTemplate(template=prompt_template, input_variables=list(kwargs.keys()))
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        return chain.run(**kwargs)
+        chunks = []
+        async for chunk in self._astream_chain(llm, template, kwargs):
+            self.stream_callback(self.display_name, chunk)
+            chunks.append(chunk)
+        return "".join(chunks)
+    
+    async def astream_response(self, template: ChatPromptTemplate, **kwargs) -> AsyncIterator[str]:
+        """Stream the LLM response for the given template and kwargs chunk by chunk
+        Streamed calls bypass the LLM cache.
+        """
+        if self.llm is None:
+            yield self._placeholder_response()
+            return
+        
+        async for chunk in self._astream_chain(self.llm, template, kwargs):
+            yield chunk
+    
+    async def _astream_chain(self, llm: BaseLanguageModel, template: ChatPromptTemplate, kwargs: Dict[str, Any]) -> AsyncIterator[str]:
+        """Stream the reply of the given model for the template and kwargs"""
+        from langchain_core.output_parsers import StrOutputParser
+        chain = template | self._bind_max_tokens(llm, self.max_tokens) | StrOutputParser()
+        async for chunk in chain.astream(kwargs):
+            yield chunk
+    
+    async def _abatch_llm_chain(self, prompts: List[PromptValue], agents: Optional[List[RPGMakerAgent]] = None) -> List[str]:
+        """Send independent prompts to the LLM concurrently
+        agents names the owner of each prompt (this agent by default). Prompts of "fast"
+        agents go to the fast model first; rejected replies are resent to the smart model.
+        """
+        agents = agents or [self] * len(prompts)
+        if self.llm is None:
+            return [agent._placeholder_response() for agent in agents]
+        
+        responses: List[Optional[str]] = [None] * len(prompts)
+        if self.fast_llm is not None:
+            fast = [i for i, agent in enumerate(agents) if agent.complexity_hint == "fast"]
+            if fast:
+                fast_responses = await self._abatch_with(
+                    self.fast_llm, [prompts[i] for i in fast], [agents[i].max_tokens for i in fast])
+                for i, response in zip(fast, fast_responses):
+                    if agents[i].validate_response(response):
+                        responses[i] = response
+                    else:
+                        logger.debug("%s: fast model reply failed validation, retrying with the smart model", agents[i].display_name)
+        
+        smart = [i for i, response in enumerate(responses) if response is None]
+        if smart:
+            smart_responses = await self._abatch_with(
+                self.llm, [prompts[i] for i in smart], [agents[i].max_tokens for i in smart])
+            for i, response in zip(smart, smart_responses):
+                responses[i] = response
+        return responses
+    
+    @staticmethod
+    def _bind_max_tokens(llm: BaseLanguageModel, max_tokens: Optional[int]) -> Any:
+        """Cap the model's reply at max_tokens, if given"""
+        return llm.bind(max_tokens=max_tokens) if max_tokens else llm
+    
+    async def _abatch_with(self, llm: BaseLanguageModel, prompts: List[PromptValue],
+                           max_tokens: List[Optional[int]]) -> List[str]:
+        """Send prompts to the given model concurrently, one batch per token budget"""
+        from langchain_core.output_parsers import StrOutputParser
+        
+        # Group prompts by budget, smallest first
+        buckets: Dict[Optional[int], List[int]] = {}
+        for i in sorted(range(len(prompts)), key=lambda i: max_tokens[i] or 0):
+            buckets.setdefault(max_tokens[i], []).append(i)
+        
+        # Batches run one after another, so the backend only sees requests of similar length
+        # together and at most LLM_MAX_CONCURRENCY calls are in flight
+        responses: List[str] = [""] * len(prompts)
+        for budget, indices in buckets.items():
+            chain = self._bind_max_tokens(llm, budget) | StrOutputParser()
+            bucket_responses = await chain.abatch([prompts[i] for i in indices], config={"max_concurrency": LLM_MAX_CONCURRENCY})
+            for i, response in zip(indices, bucket_responses):
+                responses[i] = response
+        return responses
 
 class DirectorAgent(RPGMakerAgent):
     """Director agent that coordinates the implementation process"""
     
-    def __init__(self, llm: Optional[BaseLLM] = None):
+    complexity_hint = "smart"
+    required_keys = ("task_queue",)
+    
+    def __init__(self, llm: Optional[BaseLanguageModel] = None):
         super().__init__("director", "director", llm)
+        self.agents: Dict[str, RPGMakerAgent] = {}
+    
+    def set_agents(self, agents: Dict[str, RPGMakerAgent]):
+        """Set the specialized agents the director can dispatch tasks to"""
+        self.agents = agents
     
-    def process(self, state: GameImplementationState) -> GameImplementationState:
+    async def aprocess(self, state: GameImplementationState) -> GameImplementationState:
         """Process the current state and coordinate next steps"""
         if not state.director:
             # Initialize director state if not present
             state.director = DirectorAgentState(
                 agent_id=self.agent_id,
                 agent_type=self.agent_type,
-                task_queue=[],
+                task_queue={},
                 agent_assignments={},
                 implementation_progress={}
             )
+            state.mutate(fields=("director",))
         
         # Get current task if any
         current_task = state.director.current_task
         
         # Convert state to string representation for LLM
-        game_data_str = state.game_data.json(indent=2)
-        implementation_state_str = state.json(indent=2, exclude={"game_data"})
-        current_task_str = current_task.json(indent=2) if current_task else "No current task"
+        game_data_str = state.cached_json("game_data")
+        implementation_state_str = json.dumps(state.summarize_for_prompt())
+        current_task_str = current_task.model_dump_json() if current_task else "No current task"
         
         # Get LLM response
-        response = self._run_llm_chain(
-            DIRECTOR_PROMPT,
+        await self._arun_llm_chain(
+            get_prompts()[self.agent_type],
             game_data=game_data_str,
             implementation_state=implementation_state_str,
             current_task=current_task_str
         )
         
         # In a real implementation, parse the LLM response to update state
-        # Here we're just logging it
-        print(f"Director Agent Response:\n{response}")
+        # Here it is only logged (at DEBUG level) by _arun_llm_chain
         
         # Update state based on response (simplified for this example)
         # In a full implementation, you would parse the response and update task queue, etc.
@@ -294,23 +458,79 @@ class DirectorAgent(RPGMakerAgent):
             )
             
             # Add tasks to queue
-            state.director.task_queue = [world_builder_task, event_engineer_task]
+            state.director.tasks.add(world_builder_task)
+            state.director.tasks.add(event_engineer_task)
             
             # Update stage
             state.current_stage = "implementation"
+            state.mutate(fields=("director", "current_stage"))
+        
+        await self._run_waves(state)
+        
+        # Write the data files changed by this pass in one go
+        if self.tools:
+            self.tools.flush()
         
         return state
+    
+    async def _run_waves(self, state: GameImplementationState):
+        """Run the queued tasks wave by wave until no more can start
+        Each wave is every task whose dependencies completed in earlier waves, i.e. Kahn's
+        algorithm with the task queue's unmet-dependency counts as in-degrees. Agents share
+        the in-process state and responses are applied in claim order, so the merge is
+        deterministic.
+        """
+        tasks = state.director.tasks
+        while tasks.ready:
+            completed_before = len(tasks.completed)
+            await self._run_ready_tasks(state)
+            if len(tasks.completed) == completed_before:
+                # Nothing finished, so no new wave can start
+                break
+    
+    async def _run_ready_tasks(self, state: GameImplementationState):
+        """Run every ready task, sending the LLM calls of prompt-driven agents as one batch"""
+        batch_agents = []
+        other_agents = []
+        for task_type in state.director.tasks.ready_types():
+            agent = self.agents.get(TASK_AGENT_TYPES.get(task_type))
+            if agent is None or agent in batch_agents or agent in other_agents:
+                continue
+            if agent.prompt_template is None:
+                other_agents.append(agent)
+            else:
+                batch_agents.append(agent)
+        
+        # Claim all ready tasks before building prompts so they share one state snapshot
+        claimed = [(agent, task) for agent in batch_agents for task in agent.claim_all(state)]
+        
+        prompts = []
+        for agent, task in claimed:
+            prompts.append(agent.prompt_template.format_prompt(**agent.prompt_inputs(state, task)))
+        
+        responses, _ = await asyncio.gather(
+            self._abatch_llm_chain(prompts, [agent for agent, _ in claimed]),
+            asyncio.gather(*(agent.aprocess(state) for agent in other_agents))
+        )
+        
+        # Hand each response back to the agent that owns the task
+        for (agent, task), response in zip(claimed, responses):
+            logger.debug("%s Response:\n%s", agent.display_name, response)
+            agent.handle_response(state, task, response)
 
 class WorldBuilderAgent(RPGMakerAgent):
     """World Builder agent that creates maps and environments"""
     
-    def __init__(self, llm: Optional[BaseLLM] = None):
+    prompt_name = "world_builder"
+    complexity_hint = "fast"
+    required_keys = ("width", "height")
+    
+    def __init__(self, llm: Optional[BaseLanguageModel] = None):
         super().__init__("world_builder", "world_builder", llm)
     
-    def process(self, state: GameImplementationState) -> GameImplementationState:
-        """Process map creation tasks"""
+    def init_state(self, state: GameImplementationState):
+        """Initialize the world builder state if not present"""
         if not state.world_builder:
-            # Initialize state if not present
             state.world_builder = WorldBuilderAgentState(
                 agent_id=self.agent_id,
                 agent_type=self.agent_type,
@@ -318,60 +538,41 @@ class WorldBuilderAgent(RPGMakerAgent):
                 maps_in_progress={},
                 location_interpretations={}
             )
-        
-        # Find a task assigned to this agent
-        task = None
-        for t in state.director.task_queue:
-            if t.type == "map_creation" and t.status == "pending":
-                task = t
-                break
-        
-        if not task:
-            # No tasks for this agent
-            return state
-        
-        # Update task status
-        task.status = "in_progress"
-        task.assigned_to = self.agent_id
-        state.world_builder.current_task = task
-        
-        # Get location details from game data
+            state.mutate(fields=(self.agent_type,))
+    
+    def _find_location(self, state: GameImplementationState, task: AgentTask) -> GameLocation:
+        """Get the location for a map task, creating a default one if not found"""
         location_name = task.id.replace("create_", "").replace("_", " ")
-        location = None
-        for loc in state.game_data.locations:
-            if loc.name.lower() == location_name.lower():
-                location = loc
-                break
-        
-        if not location:
-            # Create a default location if not found
-            location = GameLocation(
-                name=location_name.title(),
-                description=f"A location called {location_name.title()}",
-                width=20,
-                height=15,
-                tileset_id=1
-            )
-            state.game_data.locations.append(location)
+        location = state.game_data.get_location(location_name)
+        if location:
+            return location
         
-        # Convert objects to string for LLM
-        game_data_str = state.game_data.json(indent=2)
-        implementation_state_str = state.json(indent=2, exclude={"game_data"})
-        current_task_str = task.json(indent=2)
-        location_details_str = location.json(indent=2)
-        
-        # Get LLM response
-        response = self._run_llm_chain(
-            WORLD_BUILDER_PROMPT,
-            game_data=game_data_str,
-            implementation_state=implementation_state_str,
-            current_task=current_task_str,
-            location_details=location_details_str
+        # Create a default location if not found
+        location = GameLocation(
+            name=location_name.title(),
+            description=f"A location called {location_name.title()}",
+            width=20,
+            height=15,
+            tileset_id=1
         )
+        state.game_data.add_location(location)
+        state.mutate(fields=("game_data",))
+        return location
+    
+    def prompt_inputs(self, state: GameImplementationState, task: AgentTask) -> Dict[str, str]:
+        """Build the prompt variables for a map creation task"""
+        location = self._find_location(state, task)
         
-        # Log response
-        print(f"World Builder Agent Response:\n{response}")
-        
+        # Convert objects to string for LLM
+        return {
+            "game_data": state.cached_json("game_data"),
+            "implementation_state": self.state_slice_json(state),
+            "current_task": task.model_dump_json(),
+            "location_details": location.model_dump_json()
+        }
+    
+    def handle_response(self, state: GameImplementationState, task: AgentTask, response: str):
+        """Create the map for a map creation task"""
         # In a real implementation, you would:
         # 1. Parse the LLM response
         # 2. Use self.tools to create the map
@@ -379,6 +580,7 @@ class WorldBuilderAgent(RPGMakerAgent):
         
         # Simulate map creation for this example
         if self.tools:
+            location = self._find_location(state, task)
             try:
                 # Example of using the tools to create a map
                 map_id = self.tools.create_map(
@@ -392,42 +594,41 @@ class WorldBuilderAgent(RPGMakerAgent):
                 state.world_builder.maps_created.append(map_id)
                 
                 # Update location with the map ID
-                for loc in state.game_data.locations:
-                    if loc.name == location.name:
-                        loc.id = map_id
-                        break
+                location.id = map_id
                 
                 # Update task status
                 task.status = "completed"
                 task.result = {"map_id": map_id}
+                state.last_result = {"task_id": task.id, **task.result}
                 state.world_builder.current_task = None
                 state.world_builder.completed_tasks.append(task.id)
                 
-                # Add to completed tasks in director
-                state.director.completed_tasks.append(task.id)
-                
-                # Remove from task queue
-                state.director.task_queue = [t for t in state.director.task_queue if t.id != task.id]
+                # Add to completed tasks in director and remove from task queue
+                state.director.tasks.mark_completed(task.id)
+                state.director.tasks.remove(task.id)
                 
                 # Update progress
                 state.implementation_progress += 0.1  # Simplified progress update
             
             except Exception as e:
-                print(f"Error creating map: {e}")
+                logger.error("Error creating map: %s", e)
                 task.status = "failed"
-        
-        return state
+            
+            state.mutate(fields=("game_data", "world_builder", "director", "last_result", "implementation_progress"))
 
 class EventEngineerAgent(RPGMakerAgent):
     """Event Engineer agent that creates events and narrative elements"""
     
-    def __init__(self, llm: Optional[BaseLLM] = None):
+    prompt_name = "event_engineer"
+    complexity_hint = "smart"
+    required_keys = ("pages",)
+    
+    def __init__(self, llm: Optional[BaseLanguageModel] = None):
         super().__init__("event_engineer", "event_engineer", llm)
     
-    def process(self, state: GameImplementationState) -> GameImplementationState:
-        """Process event creation tasks"""
+    def init_state(self, state: GameImplementationState):
+        """Initialize the event engineer state if not present"""
         if not state.event_engineer:
-            # Initialize state if not present
             state.event_engineer = EventEngineerAgentState(
                 agent_id=self.agent_id,
                 agent_type=self.agent_type,
@@ -435,31 +636,10 @@ class EventEngineerAgent(RPGMakerAgent):
                 dialogue_created=[],
                 cutscenes_created=[]
             )
-        
-        # Find a task assigned to this agent
-        task = None
-        for t in state.director.task_queue:
-            if t.type in ["event_creation", "cutscene_creation", "dialogue_creation"] and t.status == "pending":
-                # Check dependencies
-                dependencies_met = True
-                for dep_id in t.dependencies:
-                    if dep_id not in state.director.completed_tasks:
-                        dependencies_met = False
-                        break
-                
-                if dependencies_met:
-                    task = t
-                    break
-        
-        if not task:
-            # No tasks for this agent
-            return state
-        
-        # Update task status
-        task.status = "in_progress"
-        task.assigned_to = self.agent_id
-        state.event_engineer.current_task = task
-        
+            state.mutate(fields=(self.agent_type,))
+    
+    def prompt_inputs(self, state: GameImplementationState, task: AgentTask) -> Dict[str, str]:
+        """Build the prompt variables for an event creation task"""
         # Prepare event details based on task type
         event_details = {}
         if task.type == "cutscene_creation":
@@ -483,23 +663,15 @@ class EventEngineerAgent(RPGMakerAgent):
                 event_details = cutscene
         
         # Convert objects to string for LLM
-        game_data_str = state.game_data.json(indent=2)
-        implementation_state_str = state.json(indent=2, exclude={"game_data"})
-        current_task_str = task.json(indent=2)
-        event_details_str = json.dumps(event_details, indent=2)
-        
-        # Get LLM response
-        response = self._run_llm_chain(
-            EVENT_ENGINEER_PROMPT,
-            game_data=game_data_str,
-            implementation_state=implementation_state_str,
-            current_task=current_task_str,
-            event_details=event_details_str
-        )
-        
-        # Log response
-        print(f"Event Engineer Agent Response:\n{response}")
-        
+        return {
+            "game_data": state.cached_json("game_data"),
+            "implementation_state": self.state_slice_json(state),
+            "current_task": task.model_dump_json(),
+            "event_details": json.dumps(event_details)
+        }
+    
+    def handle_response(self, state: GameImplementationState, task: AgentTask, response: str):
+        """Create the event for an event creation task"""
         # Simulate event creation for this example
         if self.tools and task.type == "cutscene_creation":
             try:
@@ -507,23 +679,18 @@ class EventEngineerAgent(RPGMakerAgent):
                 map_id = state.game_data.locations[0].id if state.game_data.locations else 1
                 
                 # Example: Create a simple event for the cutscene
-                from rmmz_tools import EventPage, EventCommand
-                
-                # Create commands for intro message
-                commands = [
-                    self.tools.add_message_command("Welcome to our game!", "Actor1", 0),
-                    self.tools.add_text_command("This is the beginning of an epic adventure."),
-                    self.tools.add_text_command("Are you ready to begin?"),
-                ]
-                
-                # Add a choice
-                choice_commands = self.tools.add_choice_command(["Yes, I'm ready!", "Tell me more first."])
-                commands.extend(choice_commands)
+                # with an intro message and a choice
+                commands = _build_intro_commands(
+                    "Welcome to our game!",
+                    "Actor1",
+                    ("This is the beginning of an epic adventure.", "Are you ready to begin?"),
+                    ("Yes, I'm ready!", "Tell me more first.")
+                )
                 
                 # Create an event page for the cutscene
                 page = EventPage(
                     trigger=3,  # Autorun
-                    list=commands
+                    list=list(commands)
                 )
                 
                 # Create the event
@@ -547,34 +714,47 @@ class EventEngineerAgent(RPGMakerAgent):
                 # Update task status
                 task.status = "completed"
                 task.result = {"event_id": event_id, "map_id": map_id}
+                state.last_result = {"task_id": task.id, **task.result}
                 state.event_engineer.current_task = None
                 state.event_engineer.completed_tasks.append(task.id)
                 
-                # Add to completed tasks in director
-                state.director.completed_tasks.append(task.id)
-                
-                # Remove from task queue
-                state.director.task_queue = [t for t in state.director.task_queue if t.id != task.id]
+                # Add to completed tasks in director and remove from task queue
+                state.director.tasks.mark_completed(task.id)
+                state.director.tasks.remove(task.id)
                 
                 # Update progress
                 state.implementation_progress += 0.1  # Simplified progress update
             
             except Exception as e:
-                print(f"Error creating event: {e}")
+                logger.error("Error creating event: %s", e)
                 task.status = "failed"
-        
-        return state
+            
+            state.mutate(fields=("event_engineer", "director", "last_result", "implementation_progress"))
+
+@functools.lru_cache(maxsize=128)
+def _build_intro_commands(greeting: str, actor: str,
+                          lines: Tuple[str, ...] = (), choices: Tuple[str, ...] = ()) -> Tuple[EventCommand, ...]:
+    """Build the commands for an intro message, shared by cutscenes with the same content
+    The commands are only serialized, never mutated, so the cached instances can be reused.
+    """
+    commands = [message_command(greeting, actor, 0)]
+    commands.extend(text_command(line) for line in lines)
+    if choices:
+        commands.extend(choice_commands(list(choices)))
+    return tuple(commands)
 
 class CombatSystemAgent(RPGMakerAgent):
     """Combat System agent that implements battle mechanics"""
     
-    def __init__(self, llm: Optional[BaseLLM] = None):
+    complexity_hint = "smart"
+    required_keys = ("enemies", "skills")
+    
+    def __init__(self, llm: Optional[BaseLanguageModel] = None):
         super().__init__("combat_system", "combat_system", llm)
     
-    def process(self, state: GameImplementationState) -> GameImplementationState:
-        """Process combat-related tasks"""
+    def init_state(self, state: GameImplementationState):
+        """Initialize the combat system state if not present"""
         if not state.combat_system:
-            # Initialize state if not present
             state.combat_system = CombatSystemAgentState(
                 agent_id=self.agent_id,
                 agent_type=self.agent_type,
@@ -583,6 +763,11 @@ class CombatSystemAgent(RPGMakerAgent):
                 troops_created=[],
                 balance_metrics={}
             )
+            state.mutate(fields=(self.agent_type,))
+    
+    async def aprocess(self, state: GameImplementationState) -> GameImplementationState:
+        """Process combat-related tasks"""
+        self.init_state(state)
         
         # Implementation would be similar to other agents
         # For brevity, this is a simplified version
@@ -592,13 +777,15 @@ class CombatSystemAgent(RPGMakerAgent):
 class AssetManagerAgent(RPGMakerAgent):
     """Asset Manager agent that handles game resources"""
     
-    def __init__(self, llm: Optional[BaseLLM] = None):
+    complexity_hint = "fast"
+    required_keys = ("missing",)
+    
+    def __init__(self, llm: Optional[BaseLanguageModel] = None):
         super().__init__("asset_manager", "asset_manager", llm)
     
-    def process(self, state: GameImplementationState) -> GameImplementationState:
-        """Process asset management tasks"""
+    def init_state(self, state: GameImplementationState):
+        """Initialize the asset manager state if not present"""
         if not state.asset_manager:
-            # Initialize state if not present
             state.asset_manager = AssetManagerAgentState(
                 agent_id=self.agent_id,
                 agent_type=self.agent_type,
@@ -606,6 +793,11 @@ class AssetManagerAgent(RPGMakerAgent):
                 assets_available={},
                 asset_mappings={}
             )
+            state.mutate(fields=(self.agent_type,))
+    
+    async def aprocess(self, state: GameImplementationState) -> GameImplementationState:
+        """Process asset management tasks"""
+        self.init_state(state)
         
         # Implementation would be similar to other agents
         # For brevity, this is a simplified version
@@ -615,13 +807,15 @@ class AssetManagerAgent(RPGMakerAgent):
 class TestingAgent(RPGMakerAgent):
     """Testing agent that validates implementations"""
     
-    def __init__(self, llm: Optional[BaseLLM] = None):
+    complexity_hint = "fast"
+    required_keys = ("issues",)
+    
+    def __init__(self, llm: Optional[BaseLanguageModel] = None):
         super().__init__("tester", "tester", llm)
     
-    def process(self, state: GameImplementationState) -> GameImplementationState:
-        """Process testing tasks"""
+    def init_state(self, state: GameImplementationState):
+        """Initialize the tester state if not present"""
         if not state.tester:
-            # Initialize state if not present
             state.tester = TestingAgentState(
                 agent_id=self.agent_id,
                 agent_type=self.agent_type,
@@ -629,72 +823,107 @@ class TestingAgent(RPGMakerAgent):
                 test_results={},
                 issues_found=[]
             )
+            state.mutate(fields=(self.agent_type,))
+    
+    async def aprocess(self, state: GameImplementationState) -> GameImplementationState:
+        """Process testing tasks"""
+        self.init_state(state)
         
         # Implementation would be similar to other agents
         # For brevity, this is a simplified version
         
         return state
 
-def build_agent_workflow(llm: Optional[BaseLLM] = None, project_path: str = None):
-    """Build and return the agent workflow graph"""
-    # Create agents
+@functools.lru_cache(maxsize=8)
+def get_project_tools(project_path: str) -> RPGMakerTools:
+    """Get the RPGMakerTools for a project, loading its data files only once
+    The tools are shared for the life of the process. After the project is edited elsewhere
+    (e.g. in the RPG Maker editor), call get_project_tools(path).reload(), or
+    get_project_tools.cache_clear() to drop every project's tools.
+    """
+    return RPGMakerTools(project_path)
+
+# Agents reused across build_agent_workflow calls, keyed by the identity of their models and tools
+# (LangChain models aren't hashable, so functools.lru_cache can't key on them)
+AGENT_CACHE_SIZE = 8
+_agent_cache: OrderedDict = OrderedDict()
+
+def create_agents(llm: Optional[BaseLanguageModel] = None, fast_llm: Optional[BaseLanguageModel] = None,
+                  tools: Optional[RPGMakerTools] = None,
+                  stream_callback: Optional[Callable[[str, str], None]] = None) -> Dict[str, RPGMakerAgent]:
+    """Get the agents wired to the given models, tools and stream callback, keyed by agent type"""
+    key = (id(llm), id(fast_llm), id(tools), id(stream_callback))
+    cached = _agent_cache.get(key)
+    if cached is not None:
+        _agent_cache.move_to_end(key)
+        return cached[-1]
+    
     director = DirectorAgent(llm)
-    world_builder = WorldBuilderAgent(llm)
-    event_engineer = EventEngineerAgent(llm)
-    combat_system = CombatSystemAgent(llm)
-    asset_manager = AssetManagerAgent(llm)
-    tester = TestingAgent(llm)
-    
-    # Create RPGMakerTools if project path provided
-    if project_path:
-        tools = RPGMakerTools(project_path)
-        for agent in [director, world_builder, event_engineer, 
-                      combat_system, asset_manager, tester]:
+    agents = {
+        "director": director,
+        "world_builder": WorldBuilderAgent(llm),
+        "event_engineer": EventEngineerAgent(llm),
+        "combat_system": CombatSystemAgent(llm),
+        "asset_manager": AssetManagerAgent(llm),
+        "tester": TestingAgent(llm),
+    }
+    for agent in agents.values():
+        agent.set_fast_llm(fast_llm)
+        agent.set_stream_callback(stream_callback)
+        if tools:
             agent.set_tools(tools)
+    director.set_agents({name: agent for name, agent in agents.items() if agent is not director})
+    
+    # The models, tools and callback are kept alive with the agents so their ids aren't reused while cached
+    _agent_cache[key] = (llm, fast_llm, tools, stream_callback, agents)
+    if len(_agent_cache) > AGENT_CACHE_SIZE:
+        _agent_cache.popitem(last=False)
+    return agents
+
+def build_agent_workflow(llm: Optional[BaseLanguageModel] = None, project_path: str = None, checkpointer: Any = None,
+                         fast_llm: Optional[BaseLanguageModel] = None,
+                         stream_callback: Optional[Callable[[str, str], None]] = None):
+    """Build and return the agent workflow graph
+    With a checkpointer the state is saved after every node, so a run can be resumed.
+    With a fast_llm, agents hinted "fast" try it before llm (see create_openai_llms).
+    With a stream_callback, single replies are streamed to callback(display_name, chunk) and
+    skip the LLM cache.
+    """
+    try:
+        from langgraph.graph import StateGraph, END
+    except ImportError:
+        logger.warning("LangGraph not installed. Install with: pip install langgraph")
+        raise
+    
+    if llm is not None and not _llm_cache_configured:
+        configure_llm_cache()
+    
+    # Reuse the tools and agents of an earlier build for the same project and models
+    tools = get_project_tools(os.path.abspath(project_path)) if project_path else None
+    agents = create_agents(llm, fast_llm, tools, stream_callback)
     
     # Define workflow
     workflow = StateGraph(GameImplementationState)
     
-    # Add nodes
-    workflow.add_node("director", director.process)
-    workflow.add_node("world_builder", world_builder.process)
-    workflow.add_node("event_engineer", event_engineer.process)
-    workflow.add_node("combat_system", combat_system.process)
-    workflow.add_node("asset_manager", asset_manager.process)
-    workflow.add_node("tester", tester.process)
+    # Add nodes. The director runs every queued task itself, wave by wave, through the agents
+    # it dispatches to, so those agents don't get nodes of their own. Testing isn't a queued
+    # task type, so the tester keeps its node
+    workflow.add_node("director", agents["director"].aprocess)
+    workflow.add_node("tester", agents["tester"].aprocess)
+    
+    # Every run starts with the director
+    workflow.set_entry_point("director")
     
     # Helper function to determine next node
     def route_implementation(state):
-        """Route to appropriate agent based on current state"""
+        """Route to the next node based on current stage"""
         if state.current_stage == "planning":
             return "director"
-        
-        # Check for tasks in the queue
-        for task in state.director.task_queue:
-            if task.status == "pending":
-                if task.type.startswith("map"):
-                    return "world_builder"
-                elif task.type in ["event_creation", "cutscene_creation", "dialogue_creation"]:
-                    # Check dependencies
-                    dependencies_met = True
-                    for dep_id in task.dependencies:
-                        if dep_id not in state.director.completed_tasks:
-                            dependencies_met = False
-                            break
-                    
-                    if dependencies_met:
-                        return "event_engineer"
-                elif task.type in ["skill_creation", "enemy_creation", "troop_creation"]:
-                    return "combat_system"
-                elif task.type in ["asset_management"]:
-                    return "asset_manager"
-        
-        # If no pending tasks, or specific stage
         if state.current_stage == "testing":
             return "tester"
         
-        # Default to director for coordination
-        return "director"
+        # The director has run every task it could in this pass
+        return END
     
     # Define edges
     workflow.add_conditional_edges(
@@ -702,23 +931,16 @@ def build_agent_workflow(llm: Optional[BaseLLM] = None, project_path: str = None
         route_implementation,
         {
             "director": "director",
-            "world_builder": "world_builder",
-            "event_engineer": "event_engineer",
-            "combat_system": "combat_system",
-            "asset_manager": "asset_manager",
-            "tester": "tester"
+            "tester": "tester",
+            END: END
         }
     )
     
-    # All agents return to route function
-    workflow.add_edge("world_builder", "director")
-    workflow.add_edge("event_engineer", "director")
-    workflow.add_edge("combat_system", "director")
-    workflow.add_edge("asset_manager", "director")
-    workflow.add_edge("tester", "director")
+    # Testing ends the pass
+    workflow.add_edge("tester", END)
     
     # Compile
-    return workflow.compile()
+    return workflow.compile(checkpointer=checkpointer)
 
 def initialize_game_state(title: str, description: str = "") -> GameImplementationState:
     """Initialize a new game implementation state"""
@@ -736,7 +958,7 @@ def initialize_game_state(title: str, description: str = "") -> GameImplementati
     director = DirectorAgentState(
         agent_id="director",
         agent_type="director",
-        task_queue=[],
+        task_queue={},
         agent_assignments={},
         implementation_progress={}
     )
@@ -752,40 +974,70 @@ def initialize_game_state(title: str, description: str = "") -> GameImplementati
     
     return state
 
-def run_demo(project_path: str, game_title: str, game_description: str):
+async def arun_demo(project_path: str, game_title: str, game_description: str):
     """Run a simple demo of the agent workflow"""
     print(f"Initializing demo for {game_title}")
     
     # Initialize game state
     state = initialize_game_state(game_title, game_description)
     
-    # Build workflow (without an actual LLM for demo)
-    workflow = build_agent_workflow(project_path=project_path)
-    
-    # Run some iterations
-    print("\nStarting workflow execution...")
-    for i in range(5):  # Limit to 5 iterations for demo
-        print(f"\n--- Iteration {i+1} ---")
-        state = workflow(state)
+    async with contextlib.AsyncExitStack() as stack:
+        checkpointer = None
+        try:
+            from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+        except ImportError:
+            logger.warning("LangGraph SQLite checkpointer not installed. Install with: pip install langgraph-checkpoint-sqlite")
+        else:
+            checkpointer = await stack.enter_async_context(AsyncSqliteSaver.from_conn_string(CHECKPOINT_DB))
+        
+        # Build workflow (without an actual LLM for demo)
+        graph = build_agent_workflow(project_path=project_path, checkpointer=checkpointer)
+        config = {"configurable": {"thread_id": game_title}}
         
-        # Check progress
-        print(f"Current stage: {state.current_stage}")
-        print(f"Implementation progress: {state.implementation_progress * 100:.1f}%")
+        # Pick up where an earlier run of the same game left off
+        run_input = state
+        if checkpointer is not None:
+            snapshot = await graph.aget_state(config)
+            if snapshot.next:
+                # Stopped part-way: resume from the last completed node
+                run_input = None
+            elif snapshot.values:
+                # Finished: start from its final state
+                state = run_input = GameImplementationState(**snapshot.values)
         
-        # Check for completion
-        if not state.director.task_queue:
-            print("All tasks completed!")
-            break
+        # Run some iterations
+        print("\nStarting workflow execution...")
+        for i in range(5):  # Limit to 5 iterations for demo
+            print(f"\n--- Iteration {i+1} ---")
+            # The graph returns its channel values rather than the state model
+            result = await graph.ainvoke(run_input, config)
+            state = run_input = GameImplementationState(**result)
+            
+            # Check progress
+            print(f"Current stage: {state.current_stage}")
+            print(f"Implementation progress: {state.implementation_progress * 100:.1f}%")
+            
+            # Check for completion
+            if not state.director.task_queue:
+                print("All tasks completed!")
+                break
     
     # Summarize results
     print("\n--- Implementation Summary ---")
     print(f"Maps created: {state.world_builder.maps_created if state.world_builder else []}")
     print(f"Events created: {state.event_engineer.events_created if state.event_engineer else []}")
-    print(f"Completed tasks: {state.director.completed_tasks}")
+    print(f"Completed tasks: {sorted(state.director.completed_tasks)}")
     
     return state
 
+def run_demo(project_path: str, game_title: str, game_description: str):
+    """Run the demo workflow on a new event loop"""
+    return asyncio.run(arun_demo(project_path, game_title, game_description))
+
 if __name__ == "__main__":
+    logging.basicConfig(format="%(name)s: %(message)s")
+    logger.setLevel(logging.DEBUG)
+    
     # Demo project path - adjust this to your project location
     project_path = "/Users/canerakca/Desktop/workspace/rmmz-corescript-dev"
     
@@ -1,8 +1,10 @@
 """
 RPG Maker MZ Schemas - Pydantic models for game data structures
 """
-from typing import Dict, List, Any, Optional, Union
-from pydantic import BaseModel, Field
+from typing import Dict, List, Any, Optional, Union, Callable, Set, Deque, Iterable
+from collections import defaultdict, deque
+from itertools import islice
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr
 from enum import Enum
 
 # Enums for common types
@@ -48,7 +50,15 @@ class HitType(int, Enum):
 
 # Base Models
 
-class GameMetadata(BaseModel):
+class SchemaModel(BaseModel):
+    """Base for all schema models
+    Only centralizes the config every schema inherits; it doesn't change pydantic's behavior.
+    extra="ignore" is already the default and is spelled out so the policy is visible in one
+    place. Leaf models that must reject unknown keys override it with extra="forbid".
+    """
+    model_config = ConfigDict(extra="ignore")
+
+class GameMetadata(SchemaModel):
     """Game metadata and basic settings"""
     title: str
     version: str = "1.0.0"
@@ -56,7 +66,16 @@ class GameMetadata(BaseModel):
     description: str = ""
     resolution: Dict[str, int] = {"width": 816, "height": 624}
 
-class GameLocation(BaseModel):
+class EncounterEntry(SchemaModel):
+    """A troop that can be encountered on a map"""
+    model_config = ConfigDict(populate_by_name=True)
+    
+    # Aliases accept the editor's own keys
+    troop_id: int = Field(alias="troopId")
+    weight: int = 5
+    region_set: List[int] = Field(default_factory=list, alias="regionSet")
+
+class GameLocation(SchemaModel):
     """Represents a location/map in the game"""
     id: Optional[int] = None
     name: str
@@ -65,40 +84,88 @@ class GameLocation(BaseModel):
     height: int = 15
     tileset_id: int = 1
     background_music: Optional[Dict[str, Any]] = None
-    encounter_list: List[Dict[str, Any]] = Field(default_factory=list)
+    encounter_list: List[EncounterEntry] = Field(default_factory=list)
     encounter_rate: int = 30
     features: List[str] = Field(default_factory=list)
     notes: str = ""
 
-class GameCharacter(BaseModel):
+class Appearance(SchemaModel):
+    """Graphics used for a character"""
+    # Unknown keys raise rather than leaving every field at its default
+    model_config = ConfigDict(extra="forbid", populate_by_name=True)
+    
+    # Aliases accept the editor's own keys, as written by create_actor
+    character_name: str = Field("", alias="characterName")
+    character_index: int = Field(0, alias="characterIndex")
+    face_name: str = Field("", alias="faceName")
+    face_index: int = Field(0, alias="faceIndex")
+    battler_name: str = Field("", alias="battlerName")
+
+class Stats(SchemaModel):
+    """Base parameters of a character"""
+    model_config = ConfigDict(extra="forbid", populate_by_name=True)
+    
+    hp: int = 0
+    mp: int = 0
+    atk: int = 0
+    defense: int = Field(0, alias="def")  # "def" is a Python keyword
+    mat: int = 0
+    mdf: int = 0
+    agi: int = 0
+    luk: int = 0
+
+class EquipmentItem(SchemaModel):
+    """A weapon or armor equipped in a slot"""
+    model_config = ConfigDict(extra="forbid")
+    
+    slot: int = 0  # Equipment type ID
+    kind: str = "weapon"  # "weapon", "armor"
+    item_id: int
+
+class GameCharacter(SchemaModel):
     """Represents a character in the game (player or NPC)"""
     id: Optional[int] = None
     name: str
     type: str = "npc"  # "player", "npc", "enemy"
     description: str = ""
-    appearance: Dict[str, Any] = Field(default_factory=dict)
+    appearance: Appearance = Field(default_factory=Appearance)
     class_id: Optional[int] = None
     level: int = 1
-    stats: Dict[str, int] = Field(default_factory=dict)
-    equipment: List[Dict[str, Any]] = Field(default_factory=list)
+    stats: Stats = Field(default_factory=Stats)
+    equipment: List[EquipmentItem] = Field(default_factory=list)
     skills: List[int] = Field(default_factory=list)
     personality: str = ""
     backstory: str = ""
     dialogue: Dict[str, List[str]] = Field(default_factory=dict)
 
-class GameQuest(BaseModel):
+class RewardItem(SchemaModel):
+    """An item given as a quest reward"""
+    model_config = ConfigDict(extra="forbid")
+    
+    id: int
+    count: int = 1
+
+class QuestRewards(SchemaModel):
+    """Rewards for completing a quest"""
+    model_config = ConfigDict(extra="forbid")
+    
+    gold: int = 0
+    exp: int = 0
+    items: List[Union[int, RewardItem]] = Field(default_factory=list)  # Item IDs or items with counts
+
+class GameQuest(SchemaModel):
     """Represents a quest in the game"""
     id: Optional[int] = None
     name: str
     description: str = ""
     objectives: List[str] = Field(default_factory=list)
-    rewards: Dict[str, Any] = Field(default_factory=dict)
+    rewards: QuestRewards = Field(default_factory=QuestRewards)
     start_location: Union[int, str] = ""
     prerequisite_quests: List[int] = Field(default_factory=list)
     prerequisite_conditions: Dict[str, Any] = Field(default_factory=dict)
     steps: List[Dict[str, Any]] = Field(default_factory=list)
 
-class DialogueData(BaseModel):
+class DialogueData(SchemaModel):
     """Represents a dialogue interaction"""
     id: Optional[int] = None
     speaker: str
@@ -109,7 +176,7 @@ class DialogueData(BaseModel):
     condition: Optional[Dict[str, Any]] = None
     actions: Optional[List[Dict[str, Any]]] = None
 
-class CutsceneData(BaseModel):
+class CutsceneData(SchemaModel):
     """Represents a cutscene sequence"""
     id: Optional[int] = None
     name: str
@@ -118,7 +185,7 @@ class CutsceneData(BaseModel):
     actors: List[Dict[str, Any]] = Field(default_factory=list)
     sequences: List[Dict[str, Any]] = Field(default_factory=list)
 
-class BattleEncounter(BaseModel):
+class BattleEncounter(SchemaModel):
     """Represents a battle encounter"""
     id: Optional[int] = None
     name: str = "Random Encounter"
@@ -130,8 +197,13 @@ class BattleEncounter(BaseModel):
 
 # Game Data Schema - Top level container for all game data
 
-class GameDataSchema(BaseModel):
-    """Complete game data structure used by agents"""
+class GameDataSchema(SchemaModel):
+    """Complete game data structure used by agents
+    Load saved designs with GameDataSchema.model_validate_json(raw), which parses and validates
+    in one pass, and save them with model_dump_json().
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    
     metadata: GameMetadata
     locations: List[GameLocation] = Field(default_factory=list)
     characters: List[GameCharacter] = Field(default_factory=list)
@@ -142,12 +214,25 @@ class GameDataSchema(BaseModel):
     variables: Dict[str, Dict[str, Any]] = Field(default_factory=dict)
     switches: Dict[str, Dict[str, Any]] = Field(default_factory=dict)
     
-    class Config:
-        arbitrary_types_allowed = True
+    # Locations keyed by lowercased name, built on first lookup and kept up to date by add_location()
+    _location_by_name: Optional[Dict[str, GameLocation]] = PrivateAttr(default=None)
+    
+    def get_location(self, name: str) -> Optional[GameLocation]:
+        """Get a location by case-insensitive name"""
+        if self._location_by_name is None:
+            # Reversed so the first location with a given name wins
+            self._location_by_name = {loc.name.lower(): loc for loc in reversed(self.locations)}
+        return self._location_by_name.get(name.lower())
+    
+    def add_location(self, location: GameLocation):
+        """Add a location and index it by name"""
+        self.locations.append(location)
+        if self._location_by_name is not None:
+            self._location_by_name.setdefault(location.name.lower(), location)
 
 # Agent State Schemas
 
-class AgentTask(BaseModel):
+class AgentTask(SchemaModel):
     """Represents a task for an agent to perform"""
     id: str
     type: str  # "map_creation", "event_creation", "character_setup", etc.
@@ -159,7 +244,92 @@ class AgentTask(BaseModel):
     data: Dict[str, Any] = Field(default_factory=dict)
     result: Optional[Dict[str, Any]] = None
 
-class AgentState(BaseModel):
+class TaskQueue:
+    """Index over the director's task queue
+    Tasks whose dependencies are all completed are kept ready per task type,
+    so finding the next task and removing a finished one are O(1).
+    """
+    
+    def __init__(self, tasks: Dict[str, AgentTask], completed: Set[str]):
+        self.all_by_id = tasks
+        self.completed = completed
+        self.ready: Set[str] = set()
+        self.ready_by_type: Dict[str, Deque[AgentTask]] = defaultdict(deque)
+        self._dependents: Dict[str, Set[str]] = defaultdict(set)
+        self._unmet: Dict[str, int] = {}
+        
+        for task in tasks.values():
+            self._index(task)
+    
+    def _index(self, task: AgentTask):
+        """Register a pending task as ready or as waiting on its dependencies"""
+        if task.status != "pending":
+            return
+        
+        unmet = {dep_id for dep_id in task.dependencies if dep_id not in self.completed}
+        if not unmet:
+            self.ready.add(task.id)
+            self.ready_by_type[task.type].append(task)
+            return
+        
+        self._unmet[task.id] = len(unmet)
+        for dep_id in unmet:
+            self._dependents[dep_id].add(task.id)
+    
+    def _is_ready(self, task: AgentTask) -> bool:
+        """Check a queued entry is still ready and not a removed or replaced task"""
+        return task.id in self.ready and self.all_by_id.get(task.id) is task
+    
+    def add(self, task: AgentTask):
+        """Add a task to the queue"""
+        self.all_by_id[task.id] = task
+        self._index(task)
+    
+    def ready_types(self) -> List[str]:
+        """Get the task types that have at least one ready task"""
+        types = []
+        for task_type, queue in self.ready_by_type.items():
+            while queue and not self._is_ready(queue[0]):
+                queue.popleft()
+            if queue:
+                types.append(task_type)
+        return types
+    
+    def pop_ready(self, type_filter: Optional[Iterable[str]] = None) -> Optional[AgentTask]:
+        """Take the next ready task, optionally limited to the given task types"""
+        task_types = list(self.ready_by_type) if type_filter is None else type_filter
+        for task_type in task_types:
+            queue = self.ready_by_type.get(task_type)
+            while queue:
+                task = queue.popleft()
+                if self._is_ready(task):
+                    self.ready.discard(task.id)
+                    return task
+        return None
+    
+    def mark_completed(self, task_id: str):
+        """Record a completed task and release the tasks waiting on it"""
+        if task_id in self.completed:
+            return
+        self.completed.add(task_id)
+        
+        for dependent_id in self._dependents.pop(task_id, ()):
+            if dependent_id not in self._unmet:
+                continue
+            self._unmet[dependent_id] -= 1
+            if self._unmet[dependent_id] == 0:
+                del self._unmet[dependent_id]
+                dependent = self.all_by_id.get(dependent_id)
+                if dependent is not None:
+                    self._index(dependent)
+    
+    def remove(self, task_id: str):
+        """Remove a task from the queue"""
+        self.all_by_id.pop(task_id, None)
+        self.ready.discard(task_id)
+        self._unmet.pop(task_id, None)
+
+class AgentState(SchemaModel):
     """Base state for all agents"""
     agent_id: str
     agent_type: str
@@ -170,9 +340,20 @@ class AgentState(BaseModel):
 
 class DirectorAgentState(AgentState):
     """State for the director agent"""
-    task_queue: List[AgentTask] = Field(default_factory=list)
+    task_queue: Dict[str, AgentTask] = Field(default_factory=dict)
+    completed_tasks: Set[str] = Field(default_factory=set)
     agent_assignments: Dict[str, List[str]] = Field(default_factory=dict)
     implementation_progress: Dict[str, float] = Field(default_factory=dict)
+    
+    _tasks: Optional[TaskQueue] = PrivateAttr(default=None)
+    
+    @property
+    def tasks(self) -> TaskQueue:
+        """Get the index over task_queue, rebuilding it if the queue was replaced"""
+        if (self._tasks is None or self._tasks.all_by_id is not self.task_queue
+                or self._tasks.completed is not self.completed_tasks):
+            self._tasks = TaskQueue(self.task_queue, self.completed_tasks)
+        return self._tasks
 
 class WorldBuilderAgentState(AgentState):
     """State for the world builder agent"""
@@ -207,8 +388,10 @@ class TestingAgentState(AgentState):
 
 # Workflow State Schema
 
-class GameImplementationState(BaseModel):
+class GameImplementationState(SchemaModel):
     """Overall state for the game implementation process"""
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    
     game_data: GameDataSchema
     director: DirectorAgentState
     world_builder: Optional[WorldBuilderAgentState] = None
@@ -219,7 +402,57 @@ class GameImplementationState(BaseModel):
     
     current_stage: str = "planning"  # "planning", "implementation", "testing", "refinement"
     implementation_progress: float = 0.0
+    last_result: Optional[Dict[str, Any]] = None  # Result of the most recently completed task
     log: List[Dict[str, Any]] = Field(default_factory=list)
     
-    class Config:
-        arbitrary_types_allowed = True
+    # Serialized JSON keyed by (field, exclude set). LangGraph builds a new state object for each
+    # node, so entries only live for the rest of the current node, not across agent steps.
+    # Left unannotated so LangGraph doesn't treat it as a state channel and checkpoint it.
+    _json_cache = PrivateAttr(default_factory=dict)
+    
+    def mutate(self, fn: Optional[Callable[["GameImplementationState"], Any]] = None,
+               fields: Optional[Iterable[str]] = None) -> "GameImplementationState":
+        """Apply fn to the state (if given) and invalidate the cached JSON
+        Call with no fn after mutating the state in place. Pass the top-level fields that
+        changed to keep the cached JSON of the others; without fields everything is dropped.
+        """
+        if fn is not None:
+            fn(self)
+        if fields is None:
+            self._json_cache.clear()
+        else:
+            # The whole-state JSON (field None) changes with any field
+            stale = {None, *fields}
+            for key in [key for key in self._json_cache if key[0] in stale]:
+                del self._json_cache[key]
+        return self
+    
+    def summarize_for_prompt(self, max_tasks: int = 5) -> Dict[str, Any]:
+        """Get a compact summary of the implementation state for LLM prompts
+        The full state stays in-process for routing; prompts only need the open work.
+        """
+        task_queue = self.director.task_queue
+        return {
+            "current_stage": self.current_stage,
+            "implementation_progress": self.implementation_progress,
+            "completed_tasks": len(self.director.completed_tasks),
+            "open_tasks": len(task_queue),
+            "next_tasks": [
+                task.model_dump(exclude_defaults=True, exclude_none=True)
+                for task in islice(task_queue.values(), max_tasks)
+            ],
+            "last_result": self.last_result
+        }
+    
+    def cached_json(self, field: Optional[str] = None, exclude: Optional[Set[str]] = None) -> str:
+        """Get compact JSON for the state or one of its fields, reused until mutate() touches it"""
+        key = (field, frozenset(exclude or ()))
+        json_str = self._json_cache.get(key)
+        if json_str is not None:
+            return json_str
+        
+        # Defaults and None are left out to keep prompts short
+        target = getattr(self, field) if field else self
+        json_str = target.model_dump_json(exclude=exclude, exclude_defaults=True, exclude_none=True)
+        self._json_cache[key] = json_str
+        return json_str
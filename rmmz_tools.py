@@ -1,11 +1,40 @@
 """
 RPG Maker MZ Tools - Python wrapper for programmatic game creation
 """
+import array
+import functools
 import json
 import os
+import re
 import shutil
-from typing import Dict, List, Any, Optional, Union
-from pydantic import BaseModel, Field
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Set, Union
+from pydantic import BaseModel, Field, TypeAdapter
+
+# orjson parses and serializes much faster than the stdlib; fall back when it isn't installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _json_loads(raw: bytes) -> Any:
+    """Parse JSON from raw file bytes"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+def _json_default(obj: Any) -> Any:
+    """Convert values the JSON encoders don't handle natively"""
+    if isinstance(obj, array.array):
+        # Map tile data is kept as a compact array until it is written
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def _json_dumps(data: Any) -> bytes:
+    """Serialize data to UTF-8 JSON bytes indented like the editor's files"""
+    if orjson is not None:
+        return orjson.dumps(data, default=_json_default, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, default=_json_default, ensure_ascii=False, indent=2).encode("utf-8")
 
 class EventCommand(BaseModel):
     """Represents a single event command in RPG Maker MZ"""
@@ -95,8 +124,138 @@ class Skill(BaseModel):
     formula: str = "0"
     effects: List[Dict[str, Any]] = Field(default_factory=list)
 
+# Stats progression given to new classes (8 params over 100 levels, simplified). Immutable,
+# so every class can share it; it is written out as nested JSON arrays
+_DEFAULT_PARAMS = ((1,) * 8,) * 100
+
+@functools.lru_cache(maxsize=2048)
+def _map_filename(map_id: int) -> str:
+    """Get the data file name of a map"""
+    return f"Map{map_id:03d}.json"
+
+# Map header fields returned by get_map_meta, and a pattern matching one of them with its value
+_MAP_META_FIELDS = ("displayName", "width", "height", "tilesetId")
+_MAP_META_PATTERN = re.compile(rb'"(displayName|width|height|tilesetId)"\s*:\s*("(?:[^"\\]|\\.)*"|-?\d+)')
+
+# Most unchanged map files kept in memory; the least recently loaded ones are dropped first
+MAP_CACHE_SIZE = 32
+
+# Data files loaded when the tools are created
+_DATA_FILES = (
+    "System.json", "MapInfos.json", "Actors.json", "Classes.json", "Skills.json",
+    "Items.json", "Weapons.json", "Armors.json", "Enemies.json", "Troops.json",
+    "States.json", "Animations.json", "Tilesets.json", "CommonEvents.json",
+)
+
+# The constants below are built once, so model_construct is fine here. Commands built per
+# call use the validating EventCommand(...) constructor: on pydantic 2.x it is about twice
+# as fast as model_construct, whose default handling runs in Python.
+
+# End event command closing every common event and the default page. The lists it ends are
+# only serialized, never edited, so one instance is shared
+_END_CMD = EventCommand.model_construct(code=0, parameters=[])
+
+# Page used for events created without pages. Shared by every such event: pages
+# are only read when the event is serialized, so it is never mutated
+_DEFAULT_COND = {
+    "actorId": 1,
+    "actorValid": False,
+    "itemId": 1,
+    "itemValid": False,
+    "selfSwitchCh": "A",
+    "selfSwitchValid": False,
+    "switch1Id": 1,
+    "switch1Valid": False,
+    "switch2Id": 1,
+    "switch2Valid": False,
+    "variableId": 1,
+    "variableValid": False,
+    "variableValue": 0
+}
+_DEFAULT_IMG = {
+    "characterIndex": 0,
+    "characterName": "",
+    "direction": 2,
+    "pattern": 1,
+    "tileId": 0
+}
+_DEFAULT_PAGE = EventPage.model_construct(
+    conditions=_DEFAULT_COND,
+    image=_DEFAULT_IMG,
+    list=[
+        _END_CMD  # End event
+    ]
+)
+
+# Serializers for lists of event data, built once so each dump is a single pydantic-core pass
+_PAGES_ADAPTER = TypeAdapter(List[EventPage])
+_COMMANDS_ADAPTER = TypeAdapter(List[EventCommand])
+
+# Event command builders. They don't need any project data, so they can be called (and
+# cached) without an RPGMakerTools instance; the add_*_command methods delegate to them
+
+def message_command(text: str, face_name: str = "", face_index: int = 0) -> EventCommand:
+    """Create a message display command"""
+    return EventCommand(
+        code=101,  # Show Text
+        parameters=[face_name, face_index, 0, 0, text]
+    )
+
+def text_command(text: str) -> EventCommand:
+    """Create a text continuation command"""
+    return EventCommand(
+        code=401,  # Additional Text Data
+        parameters=[text]
+    )
+
+def choice_commands(choices: List[str], cancel_type: int = 0) -> List[EventCommand]:
+    """Create a set of commands for showing choices"""
+    commands = [
+        EventCommand(
+            code=102,  # Show Choices
+            parameters=[choices, cancel_type]
+        )
+    ]
+    
+    # Add choice branches
+    for i in range(len(choices)):
+        commands.append(
+            EventCommand(
+                code=402,  # When [choice]
+                parameters=[0, i]
+            )
+        )
+        # Add end choice branch
+        commands.append(
+            EventCommand(
+                code=0,  # End Event Processing
+                parameters=[]
+            )
+        )
+    
+    # Add cancel branch if needed
+    if cancel_type > 0:
+        commands.append(
+            EventCommand(
+                code=403,  # When Cancel
+                parameters=[]
+            )
+        )
+        commands.append(
+            EventCommand(
+                code=0,  # End Event Processing
+                parameters=[]
+            )
+        )
+    
+    return commands
+
 class RPGMakerTools:
-    """Tools for interacting with RPG Maker MZ data programmatically"""
+    """Tools for interacting with RPG Maker MZ data programmatically
+    Changes are kept in memory until flush(); used as a context manager, the tools flush on exit.
+    Files changed on disk since they were loaded (e.g. in the editor) are not overwritten by
+    flush(); call reload() to pick up those changes.
+    """
     
     def __init__(self, project_path: str):
         """Initialize with path to RPG Maker MZ project"""
@@ -107,76 +266,242 @@ class RPGMakerTools:
         if not os.path.exists(self.data_path):
             raise ValueError(f"Data directory not found at {self.data_path}")
         
+        # Full paths of data files by filename, extended as map files are used
+        self._paths: Dict[str, str] = {name: os.path.join(self.data_path, name) for name in _DATA_FILES}
+        
+        # Loaded file contents by filename, and the files changed since the last flush
+        self._cache: Dict[str, Any] = {}
+        self._dirty: Set[str] = set()
+        # Modification time of each file when it was loaded or saved, None if it didn't exist
+        self._mtimes: Dict[str, Optional[int]] = {}
+        # Files already backed up this session; only the original contents get a .bak
+        self._backed_up: Set[str] = set()
+        
         # Load common data files
         self._load_data()
     
+    def __enter__(self) -> "RPGMakerTools":
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+    
     def _load_data(self):
         """Load essential data files"""
+        # Read the files concurrently; the threads overlap their blocking file reads
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            self._cache.update(zip(_DATA_FILES, executor.map(self._load_json, _DATA_FILES)))
+        
         # System data
-        self.system = self._load_json("System.json")
+        self.system = self._get_data("System.json")
         
         # Map info
-        self.map_infos = self._load_json("MapInfos.json")
+        self.map_infos = self._get_data("MapInfos.json")
         
         # Database files
-        self.actors = self._load_json("Actors.json")
-        self.classes = self._load_json("Classes.json")
-        self.skills = self._load_json("Skills.json")
-        self.items = self._load_json("Items.json")
-        self.weapons = self._load_json("Weapons.json")
-        self.armors = self._load_json("Armors.json")
-        self.enemies = self._load_json("Enemies.json")
-        self.troops = self._load_json("Troops.json")
-        self.states = self._load_json("States.json")
-        self.animations = self._load_json("Animations.json")
-        self.tilesets = self._load_json("Tilesets.json")
-        self.common_events = self._load_json("CommonEvents.json")
+        self.actors = self._get_data("Actors.json")
+        self.classes = self._get_data("Classes.json")
+        self.skills = self._get_data("Skills.json")
+        self.items = self._get_data("Items.json")
+        self.weapons = self._get_data("Weapons.json")
+        self.armors = self._get_data("Armors.json")
+        self.enemies = self._get_data("Enemies.json")
+        self.troops = self._get_data("Troops.json")
+        self.states = self._get_data("States.json")
+        self.animations = self._get_data("Animations.json")
+        self.tilesets = self._get_data("Tilesets.json")
+        self.common_events = self._get_data("CommonEvents.json")
+        
+        # Next free ID per data list, so creating an entry doesn't rescan the list
+        self._next_id = {
+            # MapInfos.json is an array in editor projects and an object keyed by ID otherwise
+            "map_infos": self._max_id(self.map_infos.values() if isinstance(self.map_infos, dict)
+                                      else self.map_infos) + 1,
+            "actors": self._max_id(self.actors) + 1,
+            "classes": self._max_id(self.classes) + 1,
+            "skills": self._max_id(self.skills) + 1,
+            "enemies": self._max_id(self.enemies) + 1,
+            "common_events": self._max_id(self.common_events) + 1,
+        }
+        # Next free event ID per map, filled in when a map first gets an event
+        self._next_event_id: Dict[int, int] = {}
         
+        # Common events by ID, kept up to date by create_common_event
+        self._common_event_by_id: Dict[int, Dict[str, Any]] = {
+            event['id']: event for event in self.common_events if isinstance(event, dict) and 'id' in event
+        }
+    
+    @staticmethod
+    def _max_id(entries) -> int:
+        """Get the highest ID among the entries of a data list, 0 if there are none"""
+        return max((entry.get('id', 0) for entry in entries if isinstance(entry, dict)), default=0)
+    
+    def _allocate_id(self, kind: str) -> int:
+        """Take the next free ID for a data list"""
+        next_id = self._next_id[kind]
+        self._next_id[kind] = next_id + 1
+        return next_id
+    
+    def _get_data(self, filename: str) -> Any:
+        """Get the contents of a data file, loading it on first access"""
+        data = self._cache.get(filename)
+        if data is None:
+            data = self._cache[filename] = self._load_json(filename)
+            if filename.startswith("Map") and filename != "MapInfos.json":
+                self._evict_maps()
+        return data
+    
+    def _evict_maps(self):
+        """Drop the oldest unchanged maps from the cache beyond MAP_CACHE_SIZE"""
+        clean_maps = [name for name in self._cache
+                      if name.startswith("Map") and name != "MapInfos.json" and name not in self._dirty]
+        for name in clean_maps[:-MAP_CACHE_SIZE]:
+            del self._cache[name]
+            self._mtimes.pop(name, None)
+    
+    def reload(self):
+        """Drop all cached data and load it again from disk
+        Changes not yet flushed are discarded.
+        """
+        self._cache.clear()
+        self._dirty.clear()
+        self._mtimes.clear()
+        self._load_data()
+    
+    def _disk_mtime(self, filename: str) -> Optional[int]:
+        """Get a data file's modification time on disk, None if it doesn't exist"""
+        try:
+            return os.stat(self._path(filename)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+    
+    def _changed_on_disk(self, filename: str) -> bool:
+        """Check whether a file was changed on disk since it was loaded or last saved"""
+        return filename in self._mtimes and self._disk_mtime(filename) != self._mtimes[filename]
+    
+    def _path(self, filename: str) -> str:
+        """Get the full path of a data file"""
+        path = self._paths.get(filename)
+        if path is None:
+            path = self._paths[filename] = os.path.join(self.data_path, filename)
+        return path
+    
+    def _mark_dirty(self, filename: str):
+        """Record that a cached data file changed and must be written by flush()"""
+        self._dirty.add(filename)
+    
+    def flush(self) -> bool:
+        """Write every data file changed since the last flush, returning False if any failed"""
+        failed = set()
+        # MapInfos is written once, last, and held back if a map file failed to save,
+        # so it never lists a map whose file isn't on disk
+        for filename in sorted(self._dirty, key=lambda name: (name == "MapInfos.json", name)):
+            if filename == "MapInfos.json" and any(name.startswith("Map") for name in failed):
+                failed.add(filename)
+            elif self._changed_on_disk(filename):
+                # Writing would throw away the newer contents on disk
+                print(f"Not saving {filename}: it changed on disk since it was loaded; call reload()")
+                failed.add(filename)
+            elif not self._save_json(self._cache[filename], filename):
+                failed.add(filename)
+        self._dirty = failed
+        return not failed
+    
     def _load_json(self, filename: str) -> Dict[str, Any]:
         """Load a JSON file from the data directory"""
-        filepath = os.path.join(self.data_path, filename)
+        filepath = self._path(filename)
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(filepath, 'rb') as f:
+                self._mtimes[filename] = os.fstat(f.fileno()).st_mtime_ns
+                return _json_loads(f.read())
         except FileNotFoundError:
+            self._mtimes[filename] = None
             print(f"Warning: {filename} not found, returning empty dict")
             return {}
-        except json.JSONDecodeError:
+        except ValueError:  # json and orjson decode errors are both ValueErrors
             print(f"Warning: {filename} is not valid JSON, returning empty dict")
             return {}
     
     def _save_json(self, data: Dict[str, Any], filename: str) -> bool:
         """Save data to a JSON file in the data directory"""
-        filepath = os.path.join(self.data_path, filename)
+        filepath = self._path(filename)
+        temp_path = filepath + ".tmp"
         try:
-            # Create backup
-            if os.path.exists(filepath):
-                backup_path = filepath + ".bak"
-                shutil.copy2(filepath, backup_path)
+            # Back up the original file the first time it is overwritten
+            if filename not in self._backed_up and os.path.exists(filepath):
+                shutil.copy2(filepath, filepath + ".bak")
+            self._backed_up.add(filename)
             
-            # Save file
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            # Write to a temporary file and swap it in, so a failed save never leaves a truncated file
+            with open(temp_path, 'wb') as f:
+                f.write(_json_dumps(data))
+            os.replace(temp_path, filepath)
+            self._mtimes[filename] = self._disk_mtime(filename)
             return True
         except Exception as e:
             print(f"Error saving {filename}: {e}")
+            # Don't leave a partial temporary file behind
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
             return False
     
     # Map Management Tools
     
     def get_map(self, map_id: int) -> Dict[str, Any]:
-        """Get map data by ID"""
-        map_file = f"Map{map_id:03d}.json"
-        return self._load_json(map_file)
+        """Get map data by ID
+        The tile data is always a list of ints, as in maps loaded from disk.
+        """
+        map_file = _map_filename(map_id)
+        map_data = self._get_data(map_file)
+        tiles = map_data.get("data") if isinstance(map_data, dict) else None
+        if isinstance(tiles, array.array):
+            # Maps created this session keep their tiles as an array until written or read
+            map_data["data"] = tiles.tolist()
+        return map_data
+    
+    def get_map_meta(self, map_id: int) -> Dict[str, Any]:
+        """Get a map's display name, size and tileset ID without loading its tile data
+        The editor writes these fields before the tile data, so only the start of the file is
+        read; files laid out differently fall back to a full load.
+        """
+        map_file = _map_filename(map_id)
+        map_data = self._cache.get(map_file)
+        if map_data is None:
+            try:
+                header = self._read_map_header(map_file)
+            except FileNotFoundError:
+                return {}
+            meta = {match.group(1).decode(): _json_loads(match.group(2))
+                    for match in _MAP_META_PATTERN.finditer(header)}
+            if len(meta) == len(_MAP_META_FIELDS):
+                return meta
+            map_data = self.get_map(map_id)
+        return {field: map_data[field] for field in _MAP_META_FIELDS if field in map_data}
+    
+    def _read_map_header(self, map_file: str, chunk_size: int = 65536) -> bytes:
+        """Read a map file up to the start of its tile data"""
+        header = b""
+        with open(self._path(map_file), 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return header
+                # Search from just before the new chunk in case the key straddles two chunks
+                search_from = max(len(header) - 5, 0)
+                header += chunk
+                data_start = header.find(b'"data"', search_from)
+                if data_start >= 0:
+                    return header[:data_start]
     
     def create_map(self, name: str, width: int, height: int, tileset_id: int) -> int:
         """Create a new map and return its ID"""
         # Find next available map ID
-        map_ids = [info.get('id', 0) for info in self.map_infos.values() if isinstance(info, dict)]
-        next_id = max(map_ids) + 1 if map_ids else 1
+        next_id = self._allocate_id("map_infos")
         
         # Create map info entry
-        self.map_infos[str(next_id)] = {
+        map_info = {
             "id": next_id,
             "name": name,
             "expanded": True,
@@ -185,6 +510,13 @@ class RPGMakerTools:
             "scrollX": 0,
             "scrollY": 0
         }
+        if isinstance(self.map_infos, list):
+            # Editor projects index the array by map ID, with null for unused IDs
+            if len(self.map_infos) <= next_id:
+                self.map_infos.extend([None] * (next_id + 1 - len(self.map_infos)))
+            self.map_infos[next_id] = map_info
+        else:
+            self.map_infos[str(next_id)] = map_info
         
         # Create basic map data
         map_data = {
@@ -210,13 +542,15 @@ class RPGMakerTools:
             "specifyBattleback": False,
             "tilesetId": tileset_id,
             "width": width,
-            "data": [0] * (width * height * 6),  # 6 layers of map data
+            "data": array.array('h', bytes(2 * width * height * 6)),  # 6 layers of map data, zeroed
             "events": {}
         }
         
-        # Save map data and map info
-        self._save_json(map_data, f"Map{next_id:03d}.json")
-        self._save_json(self.map_infos, "MapInfos.json")
+        # Cache map data and mark it and the map info for saving
+        map_file = _map_filename(next_id)
+        self._cache[map_file] = map_data
+        self._mark_dirty(map_file)
+        self._mark_dirty("MapInfos.json")
         
         return next_id
     
@@ -229,45 +563,22 @@ class RPGMakerTools:
         
         # Find next available event ID
         events = map_data.get("events", {})
-        event_ids = [int(k) for k in events.keys() if k != "null" and k is not None]
-        next_id = max(event_ids) + 1 if event_ids else 1
+        next_id = self._next_event_id.get(map_id)
+        if next_id is None:
+            event_ids = [int(k) for k in events.keys() if k != "null" and k is not None]
+            next_id = max(event_ids, default=0) + 1
+        self._next_event_id[map_id] = next_id + 1
         
         # Default page if none provided
         if not pages:
-            pages = [EventPage(
-                conditions={
-                    "actorId": 1,
-                    "actorValid": False,
-                    "itemId": 1,
-                    "itemValid": False,
-                    "selfSwitchCh": "A",
-                    "selfSwitchValid": False,
-                    "switch1Id": 1,
-                    "switch1Valid": False,
-                    "switch2Id": 1,
-                    "switch2Valid": False,
-                    "variableId": 1,
-                    "variableValid": False,
-                    "variableValue": 0
-                },
-                image={
-                    "characterIndex": 0,
-                    "characterName": "",
-                    "direction": 2,
-                    "pattern": 1,
-                    "tileId": 0
-                },
-                list=[
-                    EventCommand(code=0, parameters=[])  # End event
-                ]
-            )]
+            pages = [_DEFAULT_PAGE]
         
         # Create event
         event_data = {
             "id": next_id,
             "name": name,
             "note": "",
-            "pages": [page.dict() for page in pages],
+            "pages": _PAGES_ADAPTER.dump_python(pages, mode="json"),
             "x": x,
             "y": y
         }
@@ -276,8 +587,8 @@ class RPGMakerTools:
         events[str(next_id)] = event_data
         map_data["events"] = events
         
-        # Save map
-        self._save_json(map_data, f"Map{map_id:03d}.json")
+        # Mark map for saving
+        self._mark_dirty(_map_filename(map_id))
         
         return next_id
     
@@ -286,8 +597,7 @@ class RPGMakerTools:
     def create_actor(self, name: str, class_id: int, initial_level: int = 1) -> int:
         """Create a new actor/character and return their ID"""
         # Find next available actor ID
-        actor_ids = [actor.get('id', 0) for actor in self.actors if isinstance(actor, dict)]
-        next_id = max(actor_ids) + 1 if actor_ids else 1
+        next_id = self._allocate_id("actors")
         
         # Create actor data
         actor_data = {
@@ -311,16 +621,15 @@ class RPGMakerTools:
         # Add to actors array
         self.actors.append(actor_data)
         
-        # Save actors
-        self._save_json(self.actors, "Actors.json")
+        # Mark actors for saving
+        self._mark_dirty("Actors.json")
         
         return next_id
     
     def create_class(self, name: str) -> int:
         """Create a new character class and return its ID"""
         # Find next available class ID
-        class_ids = [cls.get('id', 0) for cls in self.classes if isinstance(cls, dict)]
-        next_id = max(class_ids) + 1 if class_ids else 1
+        next_id = self._allocate_id("classes")
         
         # Create class data with default parameters
         class_data = {
@@ -329,15 +638,15 @@ class RPGMakerTools:
             "expParams": [30, 20, 30, 30],  # Base, Extra, Acceleration, Growth
             "traits": [],
             "learnings": [],  # Skills learned
-            "params": [[1, 1, 1, 1, 1, 1, 1, 1]] * 100,  # Stats progression (simplified)
+            "params": _DEFAULT_PARAMS,  # Stats progression (simplified)
             "meta": {}
         }
         
         # Add to classes array
         self.classes.append(class_data)
         
-        # Save classes
-        self._save_json(self.classes, "Classes.json")
+        # Mark classes for saving
+        self._mark_dirty("Classes.json")
         
         return next_id
     
@@ -347,8 +656,7 @@ class RPGMakerTools:
                      formula: str, icon_index: int = 0) -> int:
         """Create a new skill and return its ID"""
         # Find next available skill ID
-        skill_ids = [skill.get('id', 0) for skill in self.skills if isinstance(skill, dict)]
-        next_id = max(skill_ids) + 1 if skill_ids else 1
+        next_id = self._allocate_id("skills")
         
         # Create skill data
         skill_data = {
@@ -383,8 +691,8 @@ class RPGMakerTools:
         # Add to skills array
         self.skills.append(skill_data)
         
-        # Save skills
-        self._save_json(self.skills, "Skills.json")
+        # Mark skills for saving
+        self._mark_dirty("Skills.json")
         
         return next_id
     
@@ -392,8 +700,7 @@ class RPGMakerTools:
                      gold: int, exp: int) -> int:
         """Create a new enemy and return its ID"""
         # Find next available enemy ID
-        enemy_ids = [enemy.get('id', 0) for enemy in self.enemies if isinstance(enemy, dict)]
-        next_id = max(enemy_ids) + 1 if enemy_ids else 1
+        next_id = self._allocate_id("enemies")
         
         # Create enemy data
         enemy_data = {
@@ -426,8 +733,8 @@ class RPGMakerTools:
         # Add to enemies array
         self.enemies.append(enemy_data)
         
-        # Save enemies
-        self._save_json(self.enemies, "Enemies.json")
+        # Mark enemies for saving
+        self._mark_dirty("Enemies.json")
         
         return next_id
     
@@ -435,59 +742,15 @@ class RPGMakerTools:
     
     def add_message_command(self, text: str, face_name: str = "", face_index: int = 0) -> EventCommand:
         """Create a message display command"""
-        return EventCommand(
-            code=101,  # Show Text
-            parameters=[face_name, face_index, 0, 0, text]
-        )
+        return message_command(text, face_name, face_index)
     
     def add_text_command(self, text: str) -> EventCommand:
         """Create a text continuation command"""
-        return EventCommand(
-            code=401,  # Additional Text Data
-            parameters=[text]
-        )
+        return text_command(text)
     
     def add_choice_command(self, choices: List[str], cancel_type: int = 0) -> List[EventCommand]:
         """Create a set of commands for showing choices"""
-        commands = [
-            EventCommand(
-                code=102,  # Show Choices
-                parameters=[choices, cancel_type]
-            )
-        ]
-        
-        # Add choice branches
-        for i in range(len(choices)):
-            commands.append(
-                EventCommand(
-                    code=402,  # When [choice]
-                    parameters=[0, i]
-                )
-            )
-            # Add end choice branch
-            commands.append(
-                EventCommand(
-                    code=0,  # End Event Processing
-                    parameters=[]
-                )
-            )
-        
-        # Add cancel branch if needed
-        if cancel_type > 0:
-            commands.append(
-                EventCommand(
-                    code=403,  # When Cancel
-                    parameters=[]
-                )
-            )
-            commands.append(
-                EventCommand(
-                    code=0,  # End Event Processing
-                    parameters=[]
-                )
-            )
-        
-        return commands
+        return choice_commands(choices, cancel_type)
     
     def add_change_variable_command(self, variable_id: int, operation: int, value: Any) -> EventCommand:
         """Create a command to change a variable
@@ -502,7 +765,7 @@ class RPGMakerTools:
         """Create a command to change a switch"""
         return EventCommand(
             code=121,  # Change Switch
-            parameters=[switch_id, switch_id, value and 0 or 1]
+            parameters=[switch_id, switch_id, 0 if value else 1]  # 0=ON, 1=OFF
         )
     
     def add_conditional_branch(self, condition_type: int, param1: int, 
@@ -533,18 +796,14 @@ class RPGMakerTools:
     
     def get_common_event(self, event_id: int) -> Dict[str, Any]:
         """Get a common event by ID"""
-        for event in self.common_events:
-            if isinstance(event, dict) and event.get('id') == event_id:
-                return event
-        return None
+        return self._common_event_by_id.get(event_id)
     
     def create_common_event(self, name: str, trigger: int, commands: List[EventCommand]) -> int:
         """Create a common event with the given commands
         trigger: 0=None, 1=Autorun, 2=Parallel
         """
         # Find next available common event ID
-        event_ids = [event.get('id', 0) for event in self.common_events if isinstance(event, dict)]
-        next_id = max(event_ids) + 1 if event_ids else 1
+        next_id = self._allocate_id("common_events")
         
         # Create common event data
         event_data = {
@@ -552,13 +811,14 @@ class RPGMakerTools:
             "name": name,
             "switchId": 1,
             "trigger": trigger,
-            "list": [cmd.dict() for cmd in commands] + [{"code": 0, "parameters": []}]  # Add end event
+            "list": _COMMANDS_ADAPTER.dump_python([*commands, _END_CMD], mode="json")  # Add end event
         }
         
         # Add to common events array  
         self.common_events.append(event_data)
+        self._common_event_by_id[next_id] = event_data
         
-        # Save common events
-        self._save_json(self.common_events, "CommonEvents.json")
+        # Mark common events for saving
+        self._mark_dirty("CommonEvents.json")
         
         return next_id
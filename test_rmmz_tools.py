@@ -0,0 +1,155 @@
+import functools
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import rmmz_tools
+from rmmz_tools import RPGMakerTools, _DATA_FILES
+
+
+class ToolsTestCase(unittest.TestCase):
+    """Runs each test against a throwaway project with empty data files"""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.data_path = os.path.join(self._tmp.name, "data")
+        os.mkdir(self.data_path)
+        for name in _DATA_FILES:
+            self.write_data(name, {} if name == "System.json" else [])
+        self.tools = RPGMakerTools(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def write_data(self, name, data):
+        path = os.path.join(self.data_path, name)
+        with open(path, "w") as f:
+            json.dump(data, f)
+        # Make every write visible through the file's modification time
+        mtime = os.stat(path).st_mtime_ns + 1_000_000_000
+        os.utime(path, ns=(mtime, mtime))
+
+    def read_data(self, name):
+        with open(os.path.join(self.data_path, name)) as f:
+            return json.load(f)
+
+
+class ChangeSwitchCommandTest(ToolsTestCase):
+    def test_on_is_zero(self):
+        self.assertEqual(self.tools.add_change_switch_command(1, True).parameters[2], 0)
+
+    def test_off_is_one(self):
+        self.assertEqual(self.tools.add_change_switch_command(1, False).parameters[2], 1)
+
+
+class GetMapTest(ToolsTestCase):
+    def test_new_map_tiles_are_a_list(self):
+        map_id = self.tools.create_map("Town", 4, 3, 1)
+        map_data = self.tools.get_map(map_id)
+        self.assertIsInstance(map_data["data"], list)
+        self.assertEqual(len(map_data["data"]), 4 * 3 * 6)
+        json.dumps(map_data)
+
+
+class ExternalChangeTest(ToolsTestCase):
+    def test_flush_keeps_file_changed_on_disk(self):
+        self.tools.create_actor("Hero", 1)
+        self.write_data("Actors.json", [None, {"id": 1, "name": "Edited"}])
+        self.assertFalse(self.tools.flush())
+        self.assertEqual(self.read_data("Actors.json")[1]["name"], "Edited")
+
+    def test_reload_picks_up_changes(self):
+        self.write_data("Actors.json", [None, {"id": 1, "name": "Edited"}])
+        self.tools.reload()
+        self.assertEqual(self.tools.create_actor("Hero", 1), 2)
+        self.assertTrue(self.tools.flush())
+        self.assertEqual([actor["name"] for actor in self.read_data("Actors.json")[1:]], ["Edited", "Hero"])
+
+    def test_unchanged_maps_are_evicted(self):
+        size = rmmz_tools.MAP_CACHE_SIZE
+        for map_id in range(1, size + 3):
+            self.write_data(f"Map{map_id:03d}.json", {"width": 1, "height": 1, "data": [0]})
+            self.tools.get_map(map_id)
+        cached = [name for name in self.tools._cache if name.startswith("Map") and name != "MapInfos.json"]
+        self.assertEqual(len(cached), size)
+        self.assertNotIn("Map001.json", cached)
+
+
+
+# Reads map headers a few bytes at a time, so keys straddle chunk boundaries
+_small_chunks = functools.partialmethod(RPGMakerTools._read_map_header, chunk_size=7)
+
+
+@mock.patch.object(RPGMakerTools, "_read_map_header", _small_chunks)
+class GetMapMetaTest(ToolsTestCase):
+    META = {"displayName": "Town", "height": 3, "tilesetId": 2, "width": 4}
+
+    def write_raw(self, name, raw):
+        with open(os.path.join(self.data_path, name), "w") as f:
+            f.write(raw)
+
+    def test_reads_header_only(self):
+        self.write_raw("Map001.json", json.dumps({**self.META, "data": [0] * 72}, indent=2))
+        self.assertEqual(self.tools.get_map_meta(1), self.META)
+        self.assertNotIn("Map001.json", self.tools._cache)
+
+    def test_header_stops_at_data_key_for_every_chunk_size(self):
+        raw = json.dumps({**self.META, "data": [0] * 72}).encode()
+        self.write_raw("Map001.json", raw.decode())
+        for chunk_size in range(1, len(raw) + 2):
+            header = RPGMakerTools._read_map_header(self.tools, "Map001.json", chunk_size=chunk_size)
+            self.assertEqual(header, raw[:raw.index(b'"data"')], chunk_size)
+
+    def test_data_as_value_falls_back_to_full_load(self):
+        self.write_raw("Map001.json", json.dumps({**self.META, "displayName": "data", "data": [0]}))
+        self.assertEqual(self.tools.get_map_meta(1), {**self.META, "displayName": "data"})
+        self.assertIn("Map001.json", self.tools._cache)
+
+    def test_fields_after_data_fall_back_to_full_load(self):
+        self.write_raw("Map001.json", json.dumps({"data": [0], **self.META}))
+        self.assertEqual(self.tools.get_map_meta(1), self.META)
+
+    def test_missing_map(self):
+        self.assertEqual(self.tools.get_map_meta(99), {})
+
+    def test_cached_map_is_not_read_from_disk(self):
+        map_id = self.tools.create_map("Town", 4, 3, 2)
+        self.assertEqual(self.tools.get_map_meta(map_id), {"displayName": "", "height": 3, "tilesetId": 2, "width": 4})
+
+
+class FlushTest(ToolsTestCase):
+    def test_failed_map_stays_dirty_and_holds_back_map_infos(self):
+        real_replace = os.replace
+
+        def replace(src, dst):
+            if dst.endswith("Map001.json"):
+                raise OSError("disk full")
+            real_replace(src, dst)
+
+        map_id = self.tools.create_map("Town", 4, 3, 1)
+        self.tools.create_actor("Hero", 1)
+        with mock.patch("rmmz_tools.os.replace", replace):
+            self.assertFalse(self.tools.flush())
+        self.assertEqual(self.tools._dirty, {"Map001.json", "MapInfos.json"})
+        self.assertEqual(self.read_data("MapInfos.json"), [])
+        self.assertEqual(self.read_data("Actors.json")[0]["name"], "Hero")
+        self.assertFalse(os.path.exists(os.path.join(self.data_path, "Map001.json.tmp")))
+
+        self.assertTrue(self.tools.flush())
+        self.assertEqual(self.read_data("MapInfos.json")[map_id]["name"], "Town")
+        self.assertEqual(self.read_data(f"Map{map_id:03d}.json")["width"], 4)
+
+    def test_backup_keeps_original_contents(self):
+        self.tools.create_actor("Hero", 1)
+        self.assertTrue(self.tools.flush())
+        self.tools.create_actor("Sidekick", 1)
+        self.assertTrue(self.tools.flush())
+        self.assertEqual(self.read_data("Actors.json.bak"), [])
+        self.assertEqual(len(self.read_data("Actors.json")), 2)
+        self.assertEqual(sorted(os.listdir(self.data_path)), sorted([*_DATA_FILES, "Actors.json.bak"]))
+
+
+if __name__ == "__main__":
+    unittest.main()